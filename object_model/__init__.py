@@ -1,7 +1,7 @@
 from ._dataclasses import Base, Immutable, NamedPersistable, Persistable
-from ._json import dump, dumps, load, loads
+from ._json import dump, dumps, dumps_many, load, loads, loads_many
 from ._pydantic import BaseModel, ImmutableModel, NamedPersistableModel, PersistableModel
-from ._descriptors import Id
+from ._descriptors import Id, Index
 
 
 __version__ = "1.0.0"
@@ -26,6 +26,12 @@ class Base(ReplaceMixin, metaclass=__BaseMetaClass):
     def _fields(cls) -> set[str]:
         return set(f.name for f in fields(cls))
 
+    @classmethod
+    @cache
+    def _aliases(cls) -> dict[str, str]:
+        alias_generator = getattr(cls.Config, "alias_generator", None)
+        return {f.name: alias_generator(f.name) if alias_generator else f.name for f in fields(cls)}
+
     def _replace(self, /, **changes):
         return replace(self, **changes)
 
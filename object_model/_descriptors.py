@@ -13,3 +13,11 @@ class Id:
     def __set_name__(self, owner, name):
         if not self.__type:
             self.__type = owner
+
+
+class Index:
+    def __init__(self, *args):
+        self.__fields = args
+
+    def __get__(self, obj, objtype=None):
+        return self.__fields
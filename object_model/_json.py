@@ -1,14 +1,17 @@
 from dataclasses import MISSING, is_dataclass, fields
+from functools import partial
 from orjson import dumps as __dumps
 from pydantic import BaseModel, ConfigDict, TypeAdapter
+from pydantic_core import SchemaSerializer
 from pydantic.alias_generators import to_camel
-from typing import Any
+from typing import Any, Callable, Iterable
 
 
 from ._type_registry import get_type
 
 
 __type_adaptors: dict[type, TypeAdapter] = {}
+__dataclass_plans: dict[type, tuple[SchemaSerializer, frozenset[str], tuple[tuple[str, Any], ...]]] = {}
 
 
 def get_type_adaptor(typ: type) -> TypeAdapter:
@@ -25,12 +28,35 @@ def get_type_adaptor(typ: type) -> TypeAdapter:
     return type_adaptor
 
 
+def __dataclass_plan(typ: type) -> tuple[SchemaSerializer, frozenset[str], tuple[tuple[str, Any], ...]]:
+    # Work out once per class which fields are always serialised and which only when they differ from the default.
+    # The TypeAdapter's serialiser is called directly, as TypeAdapter's own dump methods cost several times as much
+
+    plan = __dataclass_plans.get(typ)
+    if plan is None:
+        flds = fields(typ)
+        plan = __dataclass_plans[typ] = (get_type_adaptor(typ).serializer,
+                                         frozenset(f.name for f in flds if f.default is MISSING),
+                                         tuple((f.name, f.default) for f in flds if f.default is not MISSING))
+
+    return plan
+
+
+def __dataclass_serialiser(data: Any) -> tuple[SchemaSerializer, set[str] | None]:
+    serialiser, required, defaults = __dataclass_plan(type(data))
+    if not defaults:
+        return serialiser, None
+
+    # Note that pydantic is much slower with a frozenset than a set for include
+    return serialiser, {*required, *(n for n, default in defaults if default != getattr(data, n))}
+
+
 def dump(data: Any) -> dict[str, Any]:
     if isinstance(data, BaseModel):
         return data.model_dump(exclude_unset=True, by_alias=True)
     elif is_dataclass(data):
-        flds = set(f.name for f in fields(data) if f.default is MISSING or f.default != getattr(data, f.name))
-        return get_type_adaptor(type(data)).dump_python(data, include=flds)
+        serialiser, include = __dataclass_serialiser(data)
+        return serialiser.to_python(data, by_alias=False, include=include)
     else:
         raise RuntimeError("Unsupported type")
 
@@ -39,12 +65,37 @@ def dumps(data: Any) -> bytes:
     if isinstance(data, BaseModel):
         return data.model_dump_json(exclude_unset=True, by_alias=True).encode()
     elif is_dataclass(data):
-        flds = set(f.name for f in fields(data) if f.default is MISSING or f.default != getattr(data, f.name))
-        return get_type_adaptor(type(data)).dump_json(data, by_alias=True, include=flds)
+        serialiser, include = __dataclass_serialiser(data)
+        return serialiser.to_json(data, by_alias=True, include=include)
     else:
         return __dumps(data)
 
 
+def dumps_many(data: Iterable[Any]) -> list[bytes]:
+    # Look up how to serialise each type once, rather than once per object
+
+    serialisers: dict[type, Callable[[Any], bytes]] = {}
+    ret = []
+
+    for d in data:
+        serialiser = serialisers.get(type(d))
+        if serialiser is None:
+            serialiser = serialisers[type(d)] = __serialiser(type(d))
+
+        ret.append(serialiser(d))
+
+    return ret
+
+
+def __serialiser(typ: type) -> Callable[[Any], bytes]:
+    if issubclass(typ, BaseModel):
+        return partial(typ.__pydantic_serializer__.to_json, exclude_unset=True, by_alias=True)
+    elif is_dataclass(typ):
+        return dumps
+    else:
+        return __dumps
+
+
 def load(data: dict[str, Any], typ: type | str) -> Any:
     if isinstance(typ, str):
         typ = get_type(typ)
@@ -59,6 +110,16 @@ def loads(data: bytes | str, typ: type | str) -> Any:
     return typ.model_validate_json(data) if issubclass(typ, BaseModel) else get_type_adaptor(typ).validate_json(data)
 
 
+def loads_many(data: Iterable[bytes | str], typ: type | str) -> list[Any]:
+    # Validate the objects as a single JSON array, in one call
+
+    if isinstance(typ, str):
+        typ = get_type(typ)
+
+    buffer = b",".join(d.encode() if isinstance(d, str) else d for d in data)
+    return get_type_adaptor(list[typ]).validate_json(b"[" + buffer + b"]")
+
+
 def schema(typ: type) -> dict[str, Any]:
     if issubclass(typ, BaseModel):
         return typ.model_json_schema(by_alias=True)
@@ -1,6 +1,7 @@
 from __future__ import annotations as __annotations
 
-from functools import cache
+from functools import cache, cached_property
+from os import environ
 from pydantic import BaseModel as PydanticBaseModel, ConfigDict
 from pydantic.alias_generators import to_camel
 from pydantic._internal._model_construction import ModelMetaclass as PydanticModelMetaclass
@@ -18,15 +19,35 @@ class __ModelMetaclass(TypeCheckMixin, PydanticModelMetaclass):
 
 
 class BaseModel(PydanticBaseModel, ReplaceMixin, metaclass=__ModelMetaclass):
-    model_config = ConfigDict(frozen=True, populate_by_name=True, alias_generator=to_camel, protected_namespaces=())
+    # Set OBJECT_MODEL_DEFER_BUILD=1 to build every model's validator and serialiser when it is first used, rather than
+    # when it is declared, which makes importing large libraries of models much faster. Or set defer_build in the
+    # model_config of just those models which should be deferred
+    model_config = ConfigDict(frozen=True, populate_by_name=True, alias_generator=to_camel, protected_namespaces=(),
+                              defer_build=environ.get("OBJECT_MODEL_DEFER_BUILD") == "1")
 
     @classmethod
     @cache
     def _fields(cls) -> set[str]:
         return set(cls.model_fields.keys())
 
+    @classmethod
+    @cache
+    def _aliases(cls) -> dict[str, str]:
+        return {n: f.alias or n for n, f in cls.model_fields.items()}
+
+    @classmethod
+    @cache
+    def _cached_properties(cls) -> tuple[str, ...]:
+        return tuple(n for n in dir(cls) if isinstance(getattr(cls, n, None), cached_property))
+
     def _replace(self, /, **changes):
-        return self.model_copy(update=changes)
+        ret = self.model_copy(update=changes)
+
+        # model_copy copies __dict__, so drop any cached properties, which would be stale for the copy
+        for name in self._cached_properties():
+            ret.__dict__.pop(name, None)
+
+        return ret
 
 
 class PersistableModel(BaseModel, PersistableMixin):
@@ -5,9 +5,26 @@ from typing import Any, Callable, Union as _Union, get_origin, get_args
 from ._type_registry import register_type
 
 
+# Annotations already checked, to what they were rewritten as. Keyed on repr as well as the annotation, as unions
+# compare equal whatever the order of their arguments, which matters to us
+__checked_types: dict[tuple[Any, str, bool], Any] = {}
+
+
 def check_type(fld: str, typ: Any, immutable_collections: bool) -> Any:
-    # Check that we have no non-serialisable or ambiguously serialisable types
+    # Check that we have no non-serialisable or ambiguously serialisable types. Annotations which can't be hashed are
+    # checked every time
+
+    try:
+        key = typ, repr(typ), immutable_collections
+        return __checked_types[key]
+    except TypeError:
+        return _check_type(fld, typ, immutable_collections)
+    except KeyError:
+        ret = __checked_types[key] = _check_type(fld, typ, immutable_collections)
+        return ret
+
 
+def _check_type(fld: str, typ: Any, immutable_collections: bool) -> Any:
     if typ in (object, Any, Callable):
         raise TypeError(f"{typ} is not a persistable type for {fld}")
 
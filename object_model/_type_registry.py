@@ -1,7 +1,93 @@
+from hashlib import blake2b
 import importlib.metadata as md
+from orjson import dumps, loads
+from os import environ, getpid, replace, scandir, stat
+from os.path import abspath, join
+from pathlib import Path
+import sys
 from pydantic_gubbins.typing import get_type_name
 
 
+# Discovering entry points reads the metadata of every installed distribution, which is slow if there are many. So
+# the ones we need are cached, in OBJECT_MODEL_CACHE_DIR (or the user's cache directory), until anything is installed,
+# removed or reinstalled, i.e. until the distributions on sys.path or their entry points change. Set
+# OBJECT_MODEL_CACHE_DIR to "" to not cache them
+
+_entry_point_group = "object-store"
+
+
+def __cache_dir() -> Path | None:
+    cache_dir = environ.get("OBJECT_MODEL_CACHE_DIR")
+    if cache_dir is not None:
+        return Path(cache_dir) if cache_dir else None
+
+    if sys.platform == "win32" and "LOCALAPPDATA" in environ:
+        return Path(environ["LOCALAPPDATA"]) / "object_model" / "cache"
+
+    return Path(environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "object_model"
+
+
+def __distributions_key() -> list[tuple[str, list[tuple[str, int | None]]]]:
+    # The distributions in each directory on sys.path, with the modification times of their entry points. Anything
+    # else, e.g. files written to the working directory, does not invalidate the cache
+    key = []
+    for path in dict.fromkeys(map(abspath, sys.path)):
+        try:
+            with scandir(path) as entries:
+                names = sorted(e.name for e in entries if e.name.endswith((".dist-info", ".egg-info")))
+        except NotADirectoryError:
+            # A zip file of distributions
+            key.append((path, [("", __mtime(path))]))
+            continue
+        except OSError:
+            continue
+
+        if names:
+            key.append((path, [(n, __mtime(join(path, n, "entry_points.txt"))) for n in names]))
+
+    return key
+
+
+def __mtime(path: str) -> int | None:
+    try:
+        return stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_entry_points() -> dict[str, str]:
+    # Entry point names to their values (module:attribute), from the cache if it is still valid. There is a cache
+    # file per set of directories holding distributions, so that each environment has its own
+
+    cache_dir = __cache_dir()
+    if cache_dir is None:
+        return {e.name: e.value for e in md.entry_points(group=_entry_point_group)}
+
+    key = loads(dumps(__distributions_key()))
+    cache_file = cache_dir / f"entry_points_{blake2b(dumps([p for p, _ in key]), digest_size=8).hexdigest()}.json"
+
+    try:
+        cached = loads(cache_file.read_bytes())
+        if cached["key"] == key:
+            return cached["entry_points"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    entry_points = {e.name: e.value for e in md.entry_points(group=_entry_point_group)}
+
+    # Write a temporary file then move it into place, so that other processes never see half a cache file. Not
+    # being able to write it just means discovering the entry points again next time
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_suffix(f".{getpid()}.tmp")
+        temp_file.write_bytes(dumps({"key": key, "entry_points": entry_points}))
+        replace(temp_file, cache_file)
+    except OSError:
+        pass
+
+    return entry_points
+
+
 class __TypeRegistry:
     __instance = None
 
@@ -9,15 +95,15 @@ class __TypeRegistry:
         if cls.__instance is None:
             cls.__instance = super().__new__(cls, *args, **kwargs)
             cls.__instance.__types = {}
-            cls.__object_store = md.entry_points(group="object-store")
+            cls.__instance.__object_store = None
 
         return cls.__instance
 
     def __getitem__(self, item) -> type:
-        typ, _is_temporary = self.__types.get(item, (None, False))
+        typ, _is_temporary = self.__registered(item)
         if not typ:
             try:
-                entry_point = self.__object_store[item]
+                entry_point = md.EntryPoint(item, self.__entry_points()[item], _entry_point_group)
                 typ, _is_temporary = self.__types[item] = entry_point.load(), False
             except KeyError:
                 raise KeyError(f"{item} not registered")
@@ -25,7 +111,7 @@ class __TypeRegistry:
         return typ
 
     def is_temporary_type(self, type_name: str) -> bool:
-        typ, is_temporary = self.__types.get(type_name, (None, False))
+        typ, is_temporary = self.__registered(type_name)
         if typ is None:
             raise RuntimeError(f"{type_name} not registered")
 
@@ -33,7 +119,13 @@ class __TypeRegistry:
 
     def register_type(self, typ: type):
         type_name = get_type_name(typ)
-        if type_name in self.__object_store.names:
+        if self.__object_store is None and type_name not in self.__types:
+            # Whether this is an entry point is worked out when first needed, so that importing modules which define
+            # types does not discover the entry points
+            self.__types[type_name] = typ, None
+            return
+
+        if type_name in self.__entry_points():
             return
 
         if type_name in self.__types:
@@ -41,6 +133,29 @@ class __TypeRegistry:
 
         self.__types[type_name] = typ, True
 
+    def __registered(self, type_name: str) -> tuple[type | None, bool | None]:
+        typ, is_temporary = self.__types.get(type_name, (None, False))
+        if typ is not None and is_temporary is None:
+            self.__entry_points()
+            typ, is_temporary = self.__types.get(type_name, (None, False))
+
+        return typ, is_temporary
+
+    def __entry_points(self) -> dict[str, str]:
+        if self.__object_store is None:
+            self.__object_store = _load_entry_points()
+
+            # Types registered before now were temporary unless they are entry points, which are instead loaded
+            # through their entry point, as for types registered since
+            for type_name, (typ, is_temporary) in tuple(self.__types.items()):
+                if is_temporary is None:
+                    if type_name in self.__object_store:
+                        del self.__types[type_name]
+                    else:
+                        self.__types[type_name] = typ, True
+
+        return self.__object_store
+
 
 def get_type(type_name: str) -> type:
     return __TypeRegistry()[type_name]
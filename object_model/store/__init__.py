@@ -4,7 +4,10 @@ from .exception import (
     ObjectStoreError,
     WrongStoreError
 )
+from .caching_store import CachingStore
+from .lazy_object import LazyObject
 from .object_result import ObjectResult
+from .persistable import precompute_serialisation
 from .sql_store import LocalStore, MemoryStore, SqlStore, TempStore
 from .union_store import UnionStore
 from .web_client import WebStoreClient
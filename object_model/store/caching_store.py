@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import datetime as dt
+from threading import Lock
+from typing import Iterable
+
+from .object_record import ObjectRecord
+from .object_store import (
+    HistoryRequest, IndexRequest, ObjectStore, ReadRequest, RegisterSchemaRequest, ScanRequest, WriteRequest,
+    match_reads, read_key
+)
+
+
+class CachingStore(ObjectStore):
+    def __init__(self, store: ObjectStore, max_size: int = 100_000, cache_latest: bool = False):
+        # Caches up to max_size of the records read from store, least recently used first out, keyed by the
+        # (object_id_type, object_id, effective_time, entry_time) of the read.
+        #
+        # Reads as of a past entry_time see immutable history, so are always cached. Reads of the latest version
+        # are only cached if cache_latest is set, in which case they see writes made through this store but not
+        # those made by anyone else
+
+        self.__store = store
+        self.__max_size = max_size
+        self.__cache_latest = cache_latest
+        self.__cache: OrderedDict[tuple[str, bytes, dt.datetime, dt.datetime], ObjectRecord] = OrderedDict()
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        super().__init__(store.check_schema, store.allow_temporary_types)
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def size(self) -> int:
+        return len(self.__cache)
+
+    @property
+    def _max_concurrent_calls(self) -> int | None:
+        return self.__store._max_concurrent_calls
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+            self.__hits = self.__misses = 0
+
+    def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        now = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+        cached: list[ObjectRecord] = []
+        uncached_reads: list[ObjectRecord] = []
+
+        with self.__lock:
+            for read in reads.reads:
+                key = read_key(read)
+                record = self.__cache.get(key)
+                if record is None:
+                    uncached_reads.append(read)
+                else:
+                    self.__cache.move_to_end(key)
+                    cached.append(record)
+
+            self.__hits += len(cached)
+            self.__misses += len(uncached_reads)
+
+        if not uncached_reads:
+            return tuple(cached)
+
+        uncached = tuple(uncached_reads)
+        records = tuple(self.__store._execute_reads(ReadRequest(reads=uncached)))
+
+        with self.__lock:
+            for key, record in match_reads(uncached, records).items():
+                _, _, effective_time, entry_time = key
+                if entry_time < now or (self.__cache_latest and self.__is_latest(effective_time, entry_time)):
+                    self.__add(key, record)
+
+        cached.extend(records)
+        return tuple(cached)
+
+    def _execute_exists(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        return self.__store._execute_exists(reads)
+
+    def _execute_history(self, request: HistoryRequest) -> Iterable[ObjectRecord]:
+        # Histories and scans are streamed and may be long, so don't cache them
+        return self.__store._execute_history(request)
+
+    def _execute_scan(self, request: ScanRequest) -> Iterable[ObjectRecord]:
+        return self.__store._execute_scan(request)
+
+    def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
+        records = tuple(self.__store._execute_writes(writes))
+
+        if self.__cache_latest:
+            with self.__lock:
+                for record in records:
+                    key = record.object_id_type, record.object_id, dt.datetime.max, dt.datetime.max
+
+                    # A new version is the latest, whereas a correction of an old one may not be
+                    if record.entry_version == 1:
+                        self.__add(key, record)
+                    else:
+                        self.__cache.pop(key, None)
+
+        return records
+
+    def register_index(self, request: IndexRequest):
+        self.__store.register_index(request)
+
+    def register_schema(self, request: RegisterSchemaRequest):
+        self.__store.register_schema(request)
+
+    def __add(self, key: tuple[str, bytes, dt.datetime, dt.datetime], record: ObjectRecord):
+        self.__cache[key] = record
+        self.__cache.move_to_end(key)
+
+        while len(self.__cache) > self.__max_size:
+            self.__cache.popitem(last=False)
+
+    @staticmethod
+    def __is_latest(effective_time: dt.datetime, entry_time: dt.datetime) -> bool:
+        return effective_time == dt.datetime.max and entry_time == dt.datetime.max
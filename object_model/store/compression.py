@@ -0,0 +1,44 @@
+from struct import Struct
+from typing import Callable, Iterable
+from zlib import DEFLATED, compressobj, decompressobj
+
+# Compressed contents are stored as a header, holding the id of the dictionary used, followed by raw deflate data.
+# JSON never starts with a NUL, so contents written without compression are read back as they are
+
+CODEC = "zlib"
+
+__magic = b"\x00z"
+__header = Struct(f">{len(__magic)}sI")
+# Deflate looks back at most 32KB, so a longer dictionary is of no use
+__max_dictionary_size = 32 * 1024
+__samples_per_dictionary = 64
+__level = 6
+
+
+def train_dictionary(samples: Iterable[bytes]) -> bytes:
+    # zlib has no dictionary trainer, but the contents of objects of the same type already share their keys and many
+    # of their values, so use a few of them. Deflate codes matches nearer the end of the dictionary in fewer bits, so
+    # those are kept if there are too many
+
+    selected = []
+    for sample in samples:
+        selected.append(sample)
+        if len(selected) == __samples_per_dictionary:
+            break
+
+    return b"".join(selected)[-__max_dictionary_size:]
+
+
+def compress(contents: bytes, dictionary_id: int, dictionary: bytes) -> bytes:
+    compressor = compressobj(__level, DEFLATED, -15, zdict=dictionary)
+    return __header.pack(__magic, dictionary_id) + compressor.compress(contents) + compressor.flush()
+
+
+def is_compressed(contents: bytes) -> bool:
+    return contents.startswith(__magic)
+
+
+def decompress(contents: bytes, dictionary: Callable[[int], bytes]) -> bytes:
+    _, dictionary_id = __header.unpack_from(contents)
+    decompressor = decompressobj(-15, zdict=dictionary(dictionary_id))
+    return decompressor.decompress(contents[__header.size:]) + decompressor.flush()
@@ -0,0 +1,141 @@
+from dataclasses import MISSING, fields
+from datetime import datetime
+from functools import cache
+from orjson import dumps, loads
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import PydanticUndefined
+from typing import Annotated, Any, Callable, get_type_hints
+from uuid import UUID
+
+from .object_record import ObjectRecord
+from .persistable import PersistableMixin
+from .._json import get_type_adaptor
+from .._type_registry import get_type
+
+
+@cache
+def _field_plan(typ: type) -> dict[str, tuple[str, TypeAdapter, Callable[[], Any] | None]]:
+    # How to deserialise each field by itself: its alias in the JSON, a validator for its type and how to make its
+    # default (fields with their default are not serialised)
+
+    aliases = typ._aliases()
+
+    if issubclass(typ, BaseModel):
+        return {n: (aliases[n],
+                    get_type_adaptor(Annotated[f.annotation, *f.metadata] if f.metadata else f.annotation),
+                    f.default_factory or (None if f.default is PydanticUndefined else lambda d=f.default: d))
+                for n, f in typ.model_fields.items()}
+
+    hints = get_type_hints(typ)
+    return {f.name: (aliases[f.name],
+                     get_type_adaptor(hints[f.name]),
+                     None if f.default_factory is MISSING and f.default is MISSING else
+                     f.default_factory if f.default_factory is not MISSING else lambda d=f.default: d)
+            for f in fields(typ)}
+
+
+class LazyObject:
+    # A persisted object whose fields are deserialised one at a time, as they are first used, rather than all at once.
+    # The contents are parsed as plain JSON, which is cheap, but only the fields used are validated, which is not.
+    # Fields are validated from JSON, as when deserialising the whole object, so that e.g. dates are not left as str.
+    # Anything else, such as a property, method or id, deserialises the whole object, as does materialise()
+    # Fields take precedence over our own attributes (object_class, object_id etc.), should their names clash
+
+    def __init__(self, record: ObjectRecord):
+        self.__record = record
+        self.__type: type[PersistableMixin] = get_type(record.object_type)
+        self.__contents: dict[str, Any] | None = None
+        self.__values: dict[str, Any] = {}
+        self.__object: PersistableMixin | None = None
+
+    def __repr__(self) -> str:
+        return f"LazyObject({self.object_type}, {self.__record.object_id.decode()})"
+
+    def __getattribute__(self, name: str) -> Any:
+        # Fields come first, so that those named e.g. type are not hidden by our own attributes
+        if not name.startswith("_LazyObject__"):
+            try:
+                plan = _field_plan(object.__getattribute__(self, "_LazyObject__type")).get(name)
+            except AttributeError:
+                # Not yet initialised, e.g. when copied
+                plan = None
+
+            if plan is not None:
+                return object.__getattribute__(self, "_LazyObject__field")(name, plan)
+
+        return object.__getattribute__(self, name)
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything that is neither a field nor one of ours
+        if name.startswith("_LazyObject__"):
+            raise AttributeError(name)
+
+        return getattr(self.materialise(), name)
+
+    def __field(self, name: str, plan: tuple[str, TypeAdapter, Callable[[], Any] | None]) -> Any:
+        if self.__object is not None:
+            return getattr(self.__object, name)
+
+        value = self.__values.get(name, MISSING)
+        if value is MISSING:
+            alias, type_adaptor, default = plan
+
+            if self.__contents is None:
+                self.__contents = loads(self.__record.object_contents)
+
+            if alias in self.__contents:
+                value = type_adaptor.validate_json(dumps(self.__contents[alias]))
+            elif default is not None:
+                value = default()
+            else:
+                raise AttributeError(f"{name} is missing from {self}")
+
+            self.__values[name] = value
+
+        return value
+
+    @property
+    def object_class(self) -> type[PersistableMixin]:
+        return self.__type
+
+    @property
+    def object_type(self) -> str:
+        return self.__record.object_type
+
+    @property
+    def object_id_type(self) -> str:
+        return self.__record.object_id_type
+
+    @property
+    def object_id(self) -> bytes:
+        return self.__record.object_id
+
+    @property
+    def object_contents(self) -> bytes:
+        return self.__record.object_contents
+
+    @property
+    def effective_time(self) -> datetime:
+        return self.__record.effective_time
+
+    @property
+    def entry_time(self) -> datetime:
+        return self.__record.entry_time
+
+    @property
+    def effective_version(self) -> int:
+        return self.__record.effective_version
+
+    @property
+    def entry_version(self) -> int:
+        return self.__record.entry_version
+
+    @property
+    def object_store_id(self) -> UUID | None:
+        return self.__record.object_store_id
+
+    def materialise(self) -> PersistableMixin:
+        if self.__object is None:
+            self.__object = self.__type.from_object_record(self.__record)
+
+        return self.__object
@@ -1,5 +1,6 @@
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import configure_mappers
 from sqlmodel import BLOB, Column, Field, Index, JSON, PrimaryKeyConstraint, SQLModel
 from uuid import UUID
 
@@ -35,3 +36,8 @@ class ObjectRecord(SQLModel, table=True):
             "postgresql_partition_by": "LIST(object_id_type)"
         }
     )
+
+
+# Records are also built with model_construct, which, unlike __init__, does not set up the mapper first. Without this,
+# reading their attributes fails in processes that have not otherwise used the ORM, such as WebStoreClient's
+configure_mappers()
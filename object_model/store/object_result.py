@@ -1,11 +1,29 @@
-from asyncio import Future
+from asyncio import InvalidStateError, wrap_future
+from concurrent.futures import Future
 
 from object_model.store.persistable import PersistableMixin
 
 
+class BatchFuture(Future):
+    # Like an asyncio Future, this raises rather than blocks if asked for a result which is not yet available, as
+    # is the case inside a store context. Unlike one, it does not need an event loop, so may be used from sync code
+
+    def result(self, timeout=None):
+        if not self.done():
+            raise InvalidStateError("Result is not set.")
+
+        return super().result()
+
+    def exception(self, timeout=None):
+        if not self.done():
+            raise InvalidStateError("Exception is not set.")
+
+        return super().exception()
+
+
 class ObjectResult:
     def __init__(self):
-        self.__future = Future()
+        self.__future = BatchFuture()
 
     @property
     def value(self):
@@ -13,7 +31,7 @@ class ObjectResult:
 
     @property
     async def value_a(self):
-        return self.__future
+        return await wrap_future(self.__future)
 
     @property
     def done(self) -> bool:
@@ -1,18 +1,24 @@
 from abc import ABC, abstractmethod
-from asyncio import Future
+from asyncio import Future as AsyncFuture, get_running_loop, to_thread, wrap_future
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
-from jsonschema import validate
+from itertools import islice
+from jsonschema import Draft202012Validator
 from orjson import loads
 from platform import system, uname
-from pydantic import BaseModel
+from re import compile as re_compile
+from pydantic import AfterValidator, BaseModel, BeforeValidator
 from pydantic_gubbins.typing import get_type_name
-from typing import Iterable
+from typing import Annotated, Any, Callable, Iterable, Iterator, TypeVar
 
-from . import ObjectResult
+from .object_result import BatchFuture, ObjectResult
 from .exception import NotFoundError
+from .lazy_object import LazyObject
 from .persistable import ImmutableMixin, ObjectRecord, PersistableMixin
-from .._json import schema
-from .._type_registry import is_temporary_type
+from .._json import dumps, schema
+from .._type_registry import get_type, is_temporary_type
+
+T = TypeVar("T")
 
 
 def _get_user_name():
@@ -25,36 +31,204 @@ def _get_user_name():
         return getpwuid(geteuid()).pw_name
 
 
+def _validate_records(records: Iterable[Any]) -> tuple[ObjectRecord, ...]:
+    # Table models skip validation when constructed from a dict, so validate records received as JSON explicitly,
+    # to get the ids, times etc. as the right types
+    return tuple(r if isinstance(r, ObjectRecord) else ObjectRecord.model_validate(r) for r in records)
+
+
+ObjectRecords = Annotated[tuple[ObjectRecord, ...], BeforeValidator(_validate_records)]
+
+
+def naive_utc(value: dt.datetime) -> dt.datetime:
+    # Stores hold times as naive UTC, so requested times must be too, both to compare with them and as keys
+    return value if value.tzinfo is None else value.astimezone(dt.UTC).replace(tzinfo=None)
+
+
+UtcTime = Annotated[dt.datetime, AfterValidator(naive_utc)]
+
+
+__identifier = re_compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def check_identifier(name: str) -> str:
+    # Field and type names are put into SQL as they are (so that the DB can match expressions to indexes), so must be
+    # plain identifiers. Checked both by stores and when requests are received
+
+    if not __identifier.fullmatch(name):
+        raise ValueError(f"{name!r} is not a valid field or type name")
+
+    return name
+
+
+Identifier = Annotated[str, AfterValidator(check_identifier)]
+
+
 class ReadRequest(BaseModel):
-    reads: tuple[ObjectRecord, ...]
+    reads: ObjectRecords
 
 
 class WriteRequest(BaseModel):
-    writes: tuple[ObjectRecord, ...]
+    writes: ObjectRecords
     username: str
     hostname: str
     comment: str
 
 
+class HistoryRequest(BaseModel):
+    # The versions of an object effective between effective_from and effective_to, as known at entry_time, in
+    # effective_version order. Callers page through them using after_version and limit
+
+    object_id_type: str
+    object_id: bytes
+    effective_from: UtcTime = dt.datetime.min
+    effective_to: UtcTime = dt.datetime.max
+    entry_time: UtcTime = dt.datetime.max
+    after_version: int = 0
+    limit: int | None = None
+
+
+class ScanRequest(BaseModel):
+    # The latest version, as of effective_time and entry_time, of each object with the given id type, in object_id
+    # order. Callers page through them using after_object_id and limit
+
+    object_id_type: str
+    effective_time: UtcTime = dt.datetime.max
+    entry_time: UtcTime = dt.datetime.max
+    after_object_id: bytes | None = None
+    limit: int | None = None
+    # Restricts the scan to objects whose (JSON) fields have the given (JSON) values
+    criteria: dict[Identifier, bytes] = {}
+
+
+class IndexRequest(BaseModel):
+    # Index objects of the id type by the given (JSON) fields
+    object_id_type: Identifier
+    fields: tuple[Identifier, ...]
+
+
 class RegisterSchemaRequest(BaseModel):
     name: str
     json_schema: dict
 
 
+def read_key(record: ObjectRecord) -> tuple[str, bytes, dt.datetime, dt.datetime]:
+    return record.object_id_type, record.object_id, record.effective_time, record.entry_time
+
+
+def match_reads(reads: Iterable[ObjectRecord],
+                records: Iterable[ObjectRecord]) -> dict[tuple[str, bytes, dt.datetime, dt.datetime], ObjectRecord]:
+    # Match each read with the most recent of the records for its id, at or before its times
+
+    records_by_id: dict[tuple[str, bytes], list[ObjectRecord]] = {}
+    for record in records:
+        records_by_id.setdefault((record.object_id_type, record.object_id), []).append(record)
+
+    ret = {}
+
+    for read in reads:
+        latest = None
+
+        for record in records_by_id.get((read.object_id_type, read.object_id), ()):
+            if record.effective_time <= read.effective_time and record.entry_time <= read.entry_time and\
+                    (latest is None or (record.effective_time, record.entry_time) >
+                     (latest.effective_time, latest.entry_time)):
+                latest = record
+
+        if latest is not None:
+            ret[read_key(read)] = latest
+
+    return ret
+
+
+def matches_criteria(record: ObjectRecord, criteria: dict[str, bytes]) -> bool:
+    if not criteria:
+        return True
+
+    contents = loads(record.object_contents)
+    return all(field in contents and contents[field] == loads(value) for field, value in criteria.items())
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.indexes: list[IndexRequest] = []
+        self.reads: list[ObjectRecord] = []
+        self.writes: list[ObjectRecord] = []
+        self.immutables: set[tuple[str, bytes]] = set()
+        self.read_results: dict[tuple[str, bytes, dt.datetime, dt.datetime], ObjectResult] = {}
+        self.lazy_read_results: dict[tuple[str, bytes, dt.datetime, dt.datetime], ObjectResult] = {}
+        self.written_objects: dict[tuple[str, bytes], list[PersistableMixin]] = {}
+        self.write_future: BatchFuture[bool] = BatchFuture()
+
+    def writes_done(self, records: Iterable[ObjectRecord]):
+        for record in records:
+            for obj in self.written_objects.pop((record.object_id_type, record.object_id)):
+                obj.init_from_record(record)
+
+        if self.written_objects:
+            raise RuntimeError("Failed to receive replies for all written objects")
+
+        self.write_future.set_result(True)
+
+    def persisted(self, records: Iterable[ObjectRecord]):
+        # These objects are in the store already, so need not be written
+        for record in records:
+            for obj in self.written_objects.pop((record.object_id_type, record.object_id), ()):
+                obj.init_from_record(record)
+
+        self.writes = [w for w in self.writes if (w.object_id_type, w.object_id) in self.written_objects]
+
+    def reads_done(self, records: Iterable[ObjectRecord]):
+        matches = match_reads(self.reads, records)
+
+        # Several reads of the same id, at different times, may be answered by the same record. Only deserialise
+        # those read other than lazily
+
+        eager = tuple({id(r): r for k, r in matches.items() if k in self.read_results}.values())
+        objs = dict(zip(map(id, eager), PersistableMixin.from_object_records(eager)))
+
+        for key, record in matches.items():
+            if key in self.read_results:
+                self.read_results.pop(key).set_result(objs[id(record)])
+
+            if key in self.lazy_read_results:
+                self.lazy_read_results.pop(key).set_result(LazyObject(record))
+
+        # Anything left over was not found
+        self.reads_failed(NotFoundError())
+
+    def reads_failed(self, exception: Exception):
+        for results in (self.read_results, self.lazy_read_results):
+            while results:
+                _, result = results.popitem()
+                result.set_exception(exception)
+
+    def failed(self, exception: Exception):
+        # If the writes failed, don't attempt the reads, which may have depended on them
+        self.write_future.set_exception(exception)
+
+        self.reads_failed(exception)
+
+
 class ObjectStore(ABC):
+    # Number of versions deserialised at a time by history
+    __history_page_size = 1000
+    # Number of immutable objects remembered as persisted, see __add_write
+    __max_persisted_immutables = 100_000
+
     def __init__(self, check_schema: bool, allow_temporary_types: bool):
         self.__allow_temporary_types = allow_temporary_types
         self.__check_schema: bool = check_schema
-        self.__json_schema = {}
+        self.__json_schema: dict[str, dict] = {}
+        self.__validators: dict[str, Draft202012Validator] = {}
+        self.__indexed_types: set[type[PersistableMixin]] = set()
+        self.__persisted_immutables: dict[tuple[str, bytes], ObjectRecord] = {}
         self.__entered = False
         self.__username = _get_user_name()
         self.__hostname = uname().node
         self.__comment = ""
-        self.__pending_reads: tuple[ObjectRecord, ...] = ()
-        self.__pending_writes: tuple[ObjectRecord, ...] = ()
-        self.__read_results: dict[tuple[str, bytes], ObjectResult] = {}
-        self.__written_objects: dict[tuple[str, bytes], PersistableMixin] = {}
-        self.__write_future: Future[bool] = Future()
+        self.__pending = _PendingBatch()
+        self.__executor: ThreadPoolExecutor | None = None
 
     def __enter__(self, comment: str = ""):
         if self.__entered:
@@ -67,6 +241,13 @@ class ObjectStore(ABC):
         self.__entered = False
         self.__execute()
 
+    async def __aenter__(self, comment: str = ""):
+        self.__enter__(comment)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__entered = False
+        await self.__execute_a()
+
     @abstractmethod
     def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
         ...
@@ -75,6 +256,46 @@ class ObjectStore(ABC):
     def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
         ...
 
+    @abstractmethod
+    def _execute_history(self, request: HistoryRequest) -> Iterable[ObjectRecord]:
+        ...
+
+    @abstractmethod
+    def _execute_scan(self, request: ScanRequest) -> Iterable[ObjectRecord]:
+        ...
+
+    def _execute_exists(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        # The records of the immutable objects with the given ids which are already in the store. Only the ids,
+        # times and versions are needed, so stores should override this to avoid fetching the contents
+        return self._execute_reads(reads)
+
+    async def _execute_reads_a(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        # Stores with a native async implementation should override this. By default, run the blocking
+        # implementation in a worker thread, so as not to block the event loop
+        return await self.__run_blocking(self._execute_reads, reads)
+
+    async def _execute_writes_a(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
+        return await self.__run_blocking(self._execute_writes, writes)
+
+    async def _execute_exists_a(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        return await self.__run_blocking(self._execute_exists, reads)
+
+    @property
+    def _max_concurrent_calls(self) -> int | None:
+        # How many blocking calls the async API may run on the store at once (None for no limit). Stores which
+        # cannot be used from several threads at once, e.g. those with a single connection, should return 1
+        return None
+
+    async def __run_blocking(self, fn: Callable[..., T], *args) -> T:
+        max_workers = self._max_concurrent_calls
+        if max_workers is None:
+            return await to_thread(fn, *args)
+
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=type(self).__name__)
+
+        return await get_running_loop().run_in_executor(self.__executor, fn, *args)
+
     @property
     def allow_temporary_types(self) -> bool:
         return self.__allow_temporary_types
@@ -88,109 +309,319 @@ class ObjectStore(ABC):
             writes_by_type = {}
 
             for write in writes.writes:
-                writes_by_type.setdefault(write.object_id_type, []).append(loads(write.object_contents))
+                writes_by_type.setdefault(write.object_type, []).append(write.object_contents)
 
-            for typ, instances in writes_by_type.items():
+            for typ, contents in writes_by_type.items():
                 if not self.__allow_temporary_types and is_temporary_type(typ):
                     raise RuntimeError(f"Cannot persist temporary type {typ}")
 
-                if typ not in self.__json_schema["$defs"]:
-                    raise RuntimeError(f"Attempt to write unkknown type {typ}")
-
-                for instance in instances:
-                    validate(schema=self.__json_schema["$defs"][typ], instance=instance)
+                validator = self.__validator(typ)
+                for instance in contents:
+                    validator.validate(loads(instance))
 
         return self._execute_writes(writes)
 
+    def __validator(self, typ: str) -> Draft202012Validator:
+        # Compiling a validator checks the schema and builds its resolver, so only do so once per type
+
+        validator = self.__validators.get(typ)
+        if validator is None:
+            if typ not in self.__json_schema:
+                raise RuntimeError(f"Attempt to write unknown type {typ}")
+
+            json_schema = {**self.__json_schema[typ], "$defs": dict(self.__json_schema)}
+            Draft202012Validator.check_schema(json_schema)
+            validator = self.__validators[typ] = Draft202012Validator(json_schema)
+
+        return validator
+
     def read(self,
              typ: type[PersistableMixin],
              *args,
              effective_time: dt.datetime = dt.datetime.max,
              entry_time: dt.datetime = dt.datetime.max,
+             lazy: bool = False,
              **kwargs) -> ObjectResult:
-        object_id_type, object_id = typ.make_id(*args, **kwargs)
+        # If lazy is set, the result is a LazyObject, which deserialises just the fields used
+        result = self.__add_read(typ, *args, effective_time=effective_time, entry_time=entry_time, lazy=lazy, **kwargs)
+        if not self.__entered:
+            self.__execute()
 
-        record = ObjectRecord(object_id_type=object_id_type,
-                              object_id=object_id,
-                              effective_time=effective_time,
-                              entry_time=entry_time)
+        return result
 
-        self.__pending_reads += (record,)
-        result = self.__read_results[(object_id_type, object_id)] = ObjectResult()
+    async def read_a(self,
+                     typ: type[PersistableMixin],
+                     *args,
+                     effective_time: dt.datetime = dt.datetime.max,
+                     entry_time: dt.datetime = dt.datetime.max,
+                     lazy: bool = False,
+                     **kwargs) -> ObjectResult:
+        result = self.__add_read(typ, *args, effective_time=effective_time, entry_time=entry_time, lazy=lazy, **kwargs)
+        if not self.__entered:
+            await self.__execute_a()
+
+        return result
 
+    def write(self, obj: PersistableMixin, as_of_effective_time: bool = False) -> BatchFuture[bool]:
+        ret = self.__add_write(obj, as_of_effective_time)
         if not self.__entered:
             self.__execute()
 
+        return ret
+
+    async def write_a(self, obj: PersistableMixin, as_of_effective_time: bool = False) -> AsyncFuture[bool]:
+        ret = wrap_future(self.__add_write(obj, as_of_effective_time))
+        if not self.__entered:
+            await self.__execute_a()
+
+        return ret
+
+    def history(self,
+                typ: type[PersistableMixin],
+                *args,
+                effective_from: dt.datetime = dt.datetime.min,
+                effective_to: dt.datetime = dt.datetime.max,
+                entry_time: dt.datetime = dt.datetime.max,
+                **kwargs) -> Iterator[PersistableMixin]:
+        # Stream the versions of an object effective between effective_from and effective_to, as known at entry_time
+
+        object_id_type, object_id = typ.make_id(*args, **kwargs)
+        records = self._execute_history(HistoryRequest(object_id_type=object_id_type,
+                                                       object_id=object_id,
+                                                       effective_from=effective_from,
+                                                       effective_to=effective_to,
+                                                       entry_time=entry_time))
+
+        return self.__materialise(records, self.__history_page_size)
+
+    def scan(self,
+             typ: type[PersistableMixin],
+             effective_time: dt.datetime = dt.datetime.max,
+             entry_time: dt.datetime = dt.datetime.max,
+             batch_size: int = 1000,
+             lazy: bool = False) -> Iterator[PersistableMixin | LazyObject]:
+        # Stream the latest version, as of effective_time and entry_time, of every object of typ (including
+        # subclasses), batch_size objects at a time. If lazy is set, as LazyObjects
+
+        return self.__scan(typ, effective_time, entry_time, batch_size, {}, lazy)
+
+    def query(self,
+              typ: type[PersistableMixin],
+              effective_time: dt.datetime = dt.datetime.max,
+              entry_time: dt.datetime = dt.datetime.max,
+              batch_size: int = 1000,
+              lazy: bool = False,
+              **criteria) -> Iterator[PersistableMixin | LazyObject]:
+        # As scan, but just the objects whose fields equal the given values. Stores use the indexes declared by typ,
+        # where they support them
+
+        aliases = typ._aliases()
+        unknown = [f for f in criteria.keys() if f not in aliases]
+        if unknown:
+            raise ValueError(f"{unknown} are not fields of {typ}")
+
+        return self.__scan(typ, effective_time, entry_time, batch_size,
+                           {aliases[f]: dumps(v) for f, v in criteria.items()}, lazy)
+
+    def __scan(self,
+               typ: type[PersistableMixin],
+               effective_time: dt.datetime,
+               entry_time: dt.datetime,
+               batch_size: int,
+               criteria: dict[str, bytes],
+               lazy: bool) -> Iterator[PersistableMixin | LazyObject]:
+        records = self._execute_scan(ScanRequest(object_id_type=get_type_name(typ.id[0]),
+                                                 effective_time=effective_time,
+                                                 entry_time=entry_time,
+                                                 criteria=criteria))
+
+        # Types in the same hierarchy share an id type, so may include objects of other types
+        if lazy:
+            return (LazyObject(r) for r in records if issubclass(get_type(r.object_type), typ))
+        else:
+            return (o for o in self.__materialise(records, batch_size) if isinstance(o, typ))
+
+    @staticmethod
+    def __materialise(records: Iterable[ObjectRecord], batch_size: int) -> Iterator[PersistableMixin]:
+        # Stores return the records lazily, and we deserialise a batch at a time, so memory use stays flat however
+        # many there are
+
+        records = iter(records)
+        while batch := tuple(islice(records, batch_size)):
+            yield from PersistableMixin.from_object_records(batch)
+
+    def __add_read(self,
+                   typ: type[PersistableMixin],
+                   *args,
+                   effective_time: dt.datetime,
+                   entry_time: dt.datetime,
+                   lazy: bool,
+                   **kwargs) -> ObjectResult:
+        object_id_type, object_id = typ.make_id(*args, **kwargs)
+        effective_time, entry_time = naive_utc(effective_time), naive_utc(entry_time)
+        key = object_id_type, object_id, effective_time, entry_time
+
+        # Identical reads share the one result (lazy and other reads have their own, but the one request). The request
+        # is built from trusted values so skip the (expensive) initialisation of the ObjectRecord table model
+
+        results = self.__pending.lazy_read_results if lazy else self.__pending.read_results
+        result = results.get(key)
+        if result is None:
+            if key not in self.__pending.read_results and key not in self.__pending.lazy_read_results:
+                self.__pending.reads.append(ObjectRecord.model_construct(object_id_type=object_id_type,
+                                                                         object_id=object_id,
+                                                                         effective_time=effective_time,
+                                                                         entry_time=entry_time))
+
+            result = results[key] = ObjectResult()
+
         return result
 
-    def write(self, obj: PersistableMixin, as_of_effective_time: bool = False) -> Future[bool]:
-        if (as_of_effective_time or obj.entry_version > 1) and isinstance(obj, ImmutableMixin):
-            raise RuntimeError(f"Cannot update immutable objects")
+    def __add_write(self, obj: PersistableMixin, as_of_effective_time: bool) -> BatchFuture[bool]:
+        key = obj.object_id_type, obj.object_id
 
-        record = ObjectRecord(object_type=obj.object_type,
-                              object_id_type=obj.object_id_type,
-                              object_id=obj.object_id,
-                              object_contents=obj.object_contents,
-                              effective_version=obj.effective_version + (0 if as_of_effective_time else 1),
-                              entry_version=obj.entry_version + 1 if as_of_effective_time else 1,
-                              effective_time=obj.effective_time if as_of_effective_time else dt.datetime.max,
-                              object_store_id=obj.object_store_id)
+        if isinstance(obj, ImmutableMixin):
+            if as_of_effective_time or obj.entry_version > 1:
+                raise RuntimeError(f"Cannot update immutable objects")
 
-        self.__pending_writes += (record,)
-        self.__written_objects[(obj.object_id_type, obj.object_id)] = obj
+            # Immutable objects are identified by their contents, so writing one again is a no-op. We need not send
+            # those we know to be in the store, nor those already in this batch. For the rest, __execute asks the
+            # store which it has, before sending their contents
 
-        ret = self.__write_future
-        if not self.__entered:
-            self.__execute()
+            persisted = self.__persisted_immutables.get(key)
+            if persisted is not None:
+                obj.init_from_record(persisted)
+                future = BatchFuture()
+                future.set_result(True)
+                return future
 
-        return ret
+            if key in self.__pending.written_objects:
+                self.__pending.written_objects[key].append(obj)
+                return self.__pending.write_future
+
+            self.__pending.immutables.add(key)
+
+        record = ObjectRecord.model_construct(object_type=obj.object_type,
+                                              object_id_type=obj.object_id_type,
+                                              object_id=obj.object_id,
+                                              object_contents=obj.object_contents,
+                                              effective_version=obj.effective_version + (0 if as_of_effective_time
+                                                                                         else 1),
+                                              entry_version=obj.entry_version + 1 if as_of_effective_time else 1,
+                                              effective_time=obj.effective_time if as_of_effective_time
+                                              else dt.datetime.max,
+                                              object_store_id=obj.object_store_id)
+
+        self.__pending.writes.append(record)
+        self.__pending.written_objects.setdefault(key, []).append(obj)
+
+        # Create the indexes declared by the type when we first write it
+        typ = type(obj)
+        if typ not in self.__indexed_types:
+            self.__indexed_types.add(typ)
+
+            if typ._indexed_fields():
+                aliases = typ._aliases()
+                self.__pending.indexes.append(IndexRequest(object_id_type=obj.object_id_type,
+                                                           fields=tuple(aliases[f] for f in typ._indexed_fields())))
+
+        return self.__pending.write_future
 
     def register_type(self, typ: type[PersistableMixin]):
         self.register_schema(RegisterSchemaRequest(name=get_type_name(typ), json_schema=schema(typ)))
 
+    def register_index(self, request: IndexRequest):
+        # Stores which support indexes override this
+        pass
+
     def register_schema(self, request: RegisterSchemaRequest):
         defs = request.json_schema.pop("$defs", {})
         defs[request.name] = request.json_schema
-        self.__json_schema.update(defs)
+
+        if any(self.__json_schema.get(name) != json_schema for name, json_schema in defs.items()):
+            # Types may refer to each other's definitions, so recompile everything
+            self.__json_schema.update(defs)
+            self.__validators.clear()
+
+    def __take_pending(self) -> tuple[_PendingBatch, str, ReadRequest]:
+        # Start a new batch before executing this one, so that async callers can queue up further requests meanwhile
+
+        pending = self.__pending
+        comment = self.__comment
+        read_request = ReadRequest(reads=pending.reads)
+
+        self.__pending = _PendingBatch()
+        self.__comment = ""
+
+        return pending, comment, read_request
+
+    def __write_request(self, pending: _PendingBatch, comment: str) -> WriteRequest:
+        return WriteRequest(writes=pending.writes, username=self.__username, hostname=self.__hostname, comment=comment)
+
+    @staticmethod
+    def __exists_request(pending: _PendingBatch) -> ReadRequest:
+        # Just the ids, so that we send no contents until we know they are needed
+        return ReadRequest(reads=tuple(ObjectRecord.model_construct(object_id_type=object_id_type, object_id=object_id)
+                                       for object_id_type, object_id in pending.immutables))
+
+    def __remember_immutables(self, pending: _PendingBatch, records: Iterable[ObjectRecord]) -> Iterable[ObjectRecord]:
+        # Remember the immutable objects now in the store (just their ids, times and versions), so that writing them
+        # again costs nothing. The oldest are forgotten first
+
+        records = tuple(records)
+
+        for record in records:
+            key = record.object_id_type, record.object_id
+            if key in pending.immutables:
+                self.__persisted_immutables[key] = ObjectRecord.model_construct(**{
+                    c.name: getattr(record, c.name) for c in ObjectRecord.__table__.c if c.name != "object_contents"})
+
+        while len(self.__persisted_immutables) > self.__max_persisted_immutables:
+            del self.__persisted_immutables[next(iter(self.__persisted_immutables))]
+
+        return records
 
     def __execute(self):
+        pending, comment, read_request = self.__take_pending()
+
         try:
-            if self.__pending_writes:
-                records = self._execute_writes(WriteRequest(writes=self.__pending_writes,
-                                                            username=self.__username,
-                                                            hostname=self.__hostname,
-                                                            comment=self.__comment))
+            for index_request in pending.indexes:
+                self.register_index(index_request)
 
-                for record in records:
-                    obj = self.__written_objects.pop((record.object_id_type, record.object_id))
-                    obj.init_from_record(record)
+            if pending.immutables:
+                existing = self._execute_exists(self.__exists_request(pending))
+                pending.persisted(self.__remember_immutables(pending, existing))
 
-                if self.__written_objects:
-                    raise RuntimeError("Failed to receive replies for all written objects")
+            written = self._execute_writes(self.__write_request(pending, comment)) if pending.writes else ()
+            pending.writes_done(self.__remember_immutables(pending, written))
+        except Exception as e:
+            pending.failed(e)
+            return
 
-            self.__write_future.set_result(True)
+        try:
+            pending.reads_done(self._execute_reads(read_request) if pending.reads else ())
         except Exception as e:
-            self.__write_future.set_exception(e)
-        else:
-            try:
-                if self.__pending_reads:
-                    records = self._execute_reads(ReadRequest(reads=self.__pending_reads))
-
-                    for record in records:
-                        result = self.__read_results.pop((record.object_id_type, record.object_id))
-                        result.set_result(PersistableMixin.from_object_record(record))
-
-                    while self.__read_results:
-                        _, result = self.__read_results.popitem()
-                        result.set_exception(NotFoundError())
-            except Exception as e:
-                while self.__read_results:
-                    _, result = self.__read_results.popitem()
-                    result.set_exception(e)
-        finally:
-            self.__write_future = Future()
-            self.__pending_reads = ()
-            self.__pending_writes = ()
-            self.__written_objects.clear()
-            self.__read_results.clear()
-            self.__comment = ""
+            pending.reads_failed(e)
+
+    async def __execute_a(self):
+        pending, comment, read_request = self.__take_pending()
+
+        try:
+            for index_request in pending.indexes:
+                await self.__run_blocking(self.register_index, index_request)
+
+            if pending.immutables:
+                existing = await self._execute_exists_a(self.__exists_request(pending))
+                pending.persisted(self.__remember_immutables(pending, existing))
+
+            written = await self._execute_writes_a(self.__write_request(pending, comment)) if pending.writes else ()
+            pending.writes_done(self.__remember_immutables(pending, written))
+        except Exception as e:
+            pending.failed(e)
+            return
+
+        try:
+            pending.reads_done(await self._execute_reads_a(read_request) if pending.reads else ())
+        except Exception as e:
+            pending.reads_failed(e)
+
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
 from abc import abstractmethod
-from datetime import datetime
-from functools import cached_property
-from hashlib import sha3_512
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import MISSING, fields, is_dataclass
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from functools import cache, cached_property
+from hashlib import blake2b, sha3_512
+from orjson import OPT_NON_STR_KEYS, OPT_PASSTHROUGH_DATACLASS, OPT_PASSTHROUGH_DATETIME, OPT_SORT_KEYS
+from orjson import dumps as orjson_dumps
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
 from pydantic_gubbins.typing import get_type_name
+from typing import Any, Callable, ClassVar, Iterable, Literal, Sequence, TypeVar, Union, get_args, get_origin,\
+    get_type_hints
+from types import UnionType
 from uuid import UUID
 
 from .object_record import ObjectRecord
-from .._descriptors import Id
-from .._json import dumps, loads
+from .._descriptors import Id, Index
+from .._json import dumps, get_type_adaptor, loads, loads_many
 
 
 class UseDerived:
@@ -49,19 +59,21 @@ class PersistableMixin:
     def id(self) -> tuple[type, tuple[str, ...]]:
         ...
 
-    @property
+    # These objects are frozen, so serialise the id and contents once per instance
+
+    @cached_property
     def object_type(self) -> str:
         return get_type_name(type(self))
 
-    @property
+    @cached_property
     def object_id_type(self) -> str:
         return get_type_name(self.id[0])
 
-    @property
+    @cached_property
     def object_id(self) -> bytes:
         return dumps(self.id[1])
 
-    @property
+    @cached_property
     def object_contents(self) -> bytes:
         return dumps(self)
 
@@ -105,17 +117,60 @@ class PersistableMixin:
         else:
             # Check the id fields all exist in our type
             _, flds = cls.id
-            all_fields = cls._fields()
-            missing = [f for f in flds if f not in all_fields and f not in cls.__annotations__ and not hasattr(cls, f)]
+            all_fields = cls.__annotated(cls)
+            missing = [f for f in flds if f not in all_fields and not hasattr(cls, f)]
             if missing:
                 raise TypeError(f"{missing} specified as id field(s) but not model field(s) of {cls}")
 
+        # Indexes are on the persisted JSON, so must be of fields, rather than properties
+        all_fields = cls.__annotated(cls)
+        missing = [f for f in cls.__indexes(cls) if f not in all_fields]
+        if missing:
+            raise TypeError(f"{missing} specified as index field(s) but not model field(s) of {cls}")
+
+        if issubclass(cls, ImmutableMixin):
+            _hasher(cls.content_hash_algorithm)
+
+    @classmethod
+    @cache
+    def _indexed_fields(cls) -> tuple[str, ...]:
+        # The fields of all the indexes declared by this class and its bases
+        return tuple(dict.fromkeys(f for c in reversed(cls.__mro__) for f in cls.__indexes(c)))
+
+    @staticmethod
+    def __annotated(typ: type) -> set[str]:
+        # The annotated names of typ and its bases. This runs from __init_subclass__, before a dataclass has been
+        # processed, so cannot use (the cached) _fields()
+        return {n for c in typ.__mro__ for n in vars(c).get("__annotations__", {})}
+
+    @staticmethod
+    def __indexes(typ: type) -> tuple[str, ...]:
+        return tuple(f for n, i in vars(typ).items() if isinstance(i, Index) for f in getattr(typ, n))
+
     @classmethod
     def from_object_record(cls, record: ObjectRecord) -> PersistableMixin:
         ret: PersistableMixin = loads(record.object_contents, record.object_type)
         ret.init_from_record(record)
         return ret
 
+    @classmethod
+    def from_object_records(cls, records: Sequence[ObjectRecord]) -> tuple[PersistableMixin, ...]:
+        # Deserialise the records a type at a time, returning the objects in the same order as the records
+
+        indices_by_type: dict[str, list[int]] = {}
+        for idx, record in enumerate(records):
+            indices_by_type.setdefault(record.object_type, []).append(idx)
+
+        ret: list[PersistableMixin | None] = [None] * len(records)
+
+        for object_type, indices in indices_by_type.items():
+            objs: list[PersistableMixin] = loads_many((records[i].object_contents for i in indices), object_type)
+            for idx, obj in zip(indices, objs):
+                obj.init_from_record(records[idx])
+                ret[idx] = obj
+
+        return tuple(ret)
+
     def init_from_record(self, record: ObjectRecord):
         self.__init(record.effective_time, record.entry_time, record.effective_version, record.entry_version,
                     record.object_store_id)
@@ -129,8 +184,178 @@ class PersistableMixin:
         object.__setattr__(self, "_PersistableMixin__object_store_id", object_store_id)
 
 
+def _xxh3_128():
+    try:
+        from xxhash import xxh3_128
+    except ImportError:
+        raise TypeError("xxh3_128 content hashes need the xxhash package")
+
+    return xxh3_128()
+
+
+# The content hash algorithms. xxh3_128 is not cryptographic, so is only for contents no one would forge collisions of
+
+_hash_algorithms: dict[str, Callable[[], Any]] = {
+    "blake2b": lambda: blake2b(digest_size=32),
+    "sha3_512": sha3_512,
+    "xxh3_128": _xxh3_128
+}
+
+
+def _hasher(algorithm: str) -> Any:
+    if algorithm not in _hash_algorithms:
+        raise TypeError(f"Unknown content hash algorithm {algorithm}, expected one of {list(_hash_algorithms)}")
+
+    return _hash_algorithms[algorithm]()
+
+
+def _needs_walking(annotation: Any, validated: bool, seen: set[type]) -> bool:
+    # Whether values of a field with this type must be canonicalised here, rather than as pydantic dumps them: those
+    # which may hold immutable objects (to use their hashes) or numbers which may be either ints or floats. Fields of
+    # dataclasses are not validated, so even those declared as floats may hold ints
+
+    origin = get_origin(annotation)
+
+    if annotation in (Any, object) or isinstance(annotation, TypeVar):
+        return True
+    elif origin is Literal:
+        return False
+    elif origin in (Union, UnionType) and int in get_args(annotation) and float in get_args(annotation):
+        return True
+    elif origin is not None:
+        return any(_needs_walking(a, validated, seen) for a in get_args(annotation) if a is not Ellipsis)
+    elif not isinstance(annotation, type):
+        return True
+    elif issubclass(annotation, ImmutableMixin) or (annotation is float and not validated):
+        return True
+    elif issubclass(annotation, BaseModel) or is_dataclass(annotation):
+        if annotation in seen:
+            return False
+
+        seen.add(annotation)
+        return _has_walked_fields(annotation, seen)
+
+    return False
+
+
+def _has_walked_fields(typ: type, seen: set[type]) -> bool:
+    validated = issubclass(typ, BaseModel)
+    return any(_needs_walking(a, validated, seen) for a, _ in _field_types_and_defaults(typ).values())
+
+
+def _field_types_and_defaults(typ: type) -> dict[str, tuple[Any, Any]]:
+    # Fields without a default have MISSING
+
+    if issubclass(typ, BaseModel):
+        return {n: (f.annotation,
+                    f.default_factory() if f.default_factory else MISSING if f.default is PydanticUndefined else
+                    f.default) for n, f in typ.model_fields.items()}
+
+    try:
+        hints = get_type_hints(typ)
+    except NameError:
+        hints = {}
+
+    return {f.name: (hints.get(f.name, Any),
+                     f.default_factory() if f.default_factory is not MISSING else f.default) for f in fields(typ)}
+
+
+@cache
+def _canonical_plan(typ: type) -> tuple[str, set[str], tuple[tuple[str, Any], ...]]:
+    # The type's name, the fields which pydantic can dump in one go and those which must be walked (with their defaults)
+
+    types_and_defaults = _field_types_and_defaults(typ)
+    validated = issubclass(typ, BaseModel)
+    walked = tuple((n, default) for n, (a, default) in types_and_defaults.items()
+                   if _needs_walking(a, validated, {typ}))
+    return get_type_name(typ), set(types_and_defaults.keys()) - set(n for n, _ in walked), walked
+
+
+def _canonical(obj: Any) -> dict[str, Any]:
+    # The fields of a model or dataclass which differ from their defaults, and its type
+
+    name, dumped, walked = _canonical_plan(type(obj))
+    ret = {"t_": name}
+
+    if dumped:
+        if isinstance(obj, BaseModel):
+            ret.update(obj.model_dump(include=dumped, exclude_defaults=True))
+        else:
+            ret.update(get_type_adaptor(type(obj)).dump_python(obj, include=dumped, exclude_defaults=True))
+
+    for field, default in walked:
+        value = getattr(obj, field)
+        if default is MISSING or value != default:
+            ret[field] = _normalised(value)
+
+    return ret
+
+
+def _normalised(value: Any) -> Any:
+    # Whole floats are written as ints, so that values which compare equal hash the same. Models, dates etc. are left
+    # to _canonical_default
+
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    elif isinstance(value, ImmutableMixin):
+        return _canonical_default(value)
+    elif isinstance(value, dict):
+        return {k: _normalised(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_normalised(v) for v in value]
+    elif isinstance(value, (set, frozenset)):
+        return _canonical_default(value)
+
+    return value
+
+
+def _canonical_default(value: Any) -> Any:
+    # Called by orjson for what it cannot (or, for dates and dataclasses, should not) serialise itself
+
+    if isinstance(value, ImmutableMixin):
+        # Use the object's hash, rather than its contents, so that it need not be serialised again
+        return {"#": value.content_hash}
+    elif isinstance(value, BaseModel) or is_dataclass(value):
+        return _canonical(value)
+    elif isinstance(value, datetime):
+        # Times in different zones may be the same instant
+        return value.astimezone(timezone.utc).isoformat() if value.tzinfo else value.isoformat()
+    elif isinstance(value, (date, time)):
+        return value.isoformat()
+    elif isinstance(value, (set, frozenset)):
+        return sorted((_normalised(v) for v in value), key=_canonical_json)
+    elif isinstance(value, Decimal):
+        return str(value.normalize())
+
+    raise TypeError(f"Cannot hash {type(value)}")
+
+
+def _canonical_json(value: Any) -> bytes:
+    return orjson_dumps(value, default=_canonical_default,
+                        option=OPT_SORT_KEYS | OPT_NON_STR_KEYS | OPT_PASSTHROUGH_DATETIME | OPT_PASSTHROUGH_DATACLASS)
+
+
 class ImmutableMixin:
+    # Recorded with the type, so that all its objects' ids are made the same way. See _hash_algorithms
+    content_hash_algorithm: ClassVar[str] = "blake2b"
+
     @cached_property
-    def content_hash(self) -> bytes:
-        # ToDo: Yes, I know this is wrong !!!
-        return sha3_512(dumps(self)).digest()
+    def content_hash(self) -> str:
+        # A hash of a canonical form of the object: its type and the fields which differ from their defaults, with
+        # keys sorted and numbers and dates normalised. Immutable members are replaced by their own hashes, so
+        # are not serialised again. The hash is the object's id, so must serialise to JSON, hence hex
+
+        hasher = _hasher(self.content_hash_algorithm)
+        hasher.update(_canonical_json(_canonical(self)))
+        return hasher.hexdigest()
+
+
+def precompute_serialisation(objs: Iterable[PersistableMixin], max_workers: int | None = None):
+    # Serialise the ids and contents of a large batch of objects in a thread pool, ahead of writing them
+
+    def precompute(obj: PersistableMixin):
+        _ = obj.object_id, obj.object_contents
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(precompute, objs):
+            pass
@@ -1,16 +1,29 @@
 import atexit
 from datetime import datetime
+from itertools import islice
+from orjson import dumps
 from psycopg.types.json import set_json_dumps, set_json_loads
-from sqlalchemy import String, and_, create_engine, func, select, text
+from sqlalchemy import (
+    BLOB, ColumnElement, Connection, DateTime, FromClause, Select, String, Text, and_, bindparam, cast, column,
+    create_engine, event, func, insert, literal, literal_column, select, text, values
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased, sessionmaker
+from sqlalchemy.pool import StaticPool
 from sqlalchemy_utc import utcnow
 from sqlmodel import Field, SQLModel, Session
 from tempfile import NamedTemporaryFile
-from typing import Iterable
+from typing import Any, Callable, Iterable, Sequence
 from uuid import UUID, uuid4
 
+from .compression import CODEC, compress, decompress, is_compressed, train_dictionary
 from .exception import FailedUpdateError, WrongStoreError
-from .object_store import ObjectStore, ReadRequest, WriteRequest
+from .object_store import (
+    HistoryRequest, IndexRequest, ObjectStore, ReadRequest, ScanRequest, WriteRequest, check_identifier,
+    matches_criteria
+)
 from .object_record import ObjectRecord
 
 
@@ -26,101 +39,459 @@ class Transactions(SQLModel, table=True):
     comment: str
 
 
+class Dictionaries(SQLModel, table=True):
+    # The dictionaries used to compress object_contents, see compression.py
+    id: int = Field(default=None, primary_key=True)
+    object_type: str = Field(index=True)
+    codec: str
+    dictionary: bytes
+
+
 class SqlStore(ObjectStore):
-    def __init__(self, connection_string: str, check_schema: bool, allow_temporary_types: bool, debug: bool = False):
+    # Keeps the number of bound parameters (or the size of the one JSON parameter) within the DB's limits
+    __max_reads_per_query = 5000
+    # Number of rows fetched at a time from the server-side cursors used for history and scan
+    __rows_per_fetch = 1000
+
+    def __init__(self,
+                 connection_string: str,
+                 check_schema: bool,
+                 allow_temporary_types: bool,
+                 debug: bool = False,
+                 pool_size: int | None = None,
+                 max_overflow: int | None = None,
+                 pool_timeout: float | None = None,
+                 pool_recycle: int | None = None,
+                 pool_pre_ping: bool = False,
+                 query_cache_size: int | None = None,
+                 prepare_threshold: int | None = 5,
+                 on_connect: Callable[[Any], None] | None = None,
+                 compress: bool = False,
+                 **engine_kwargs):
+        # Connections are pooled and reused across batches:
+        #   pool_size           Number of connections kept open (None for SQLAlchemy's default)
+        #   max_overflow        Number of connections opened beyond pool_size under load
+        #   pool_timeout        Seconds to wait for a connection when all are in use
+        #   pool_recycle        Seconds after which a connection is replaced, e.g. to beat server-side idle timeouts
+        #   pool_pre_ping       Check each connection is alive when taken from the pool
+        #   query_cache_size    Number of compiled statements cached
+        #   prepare_threshold   Executions of a statement after which psycopg prepares it on the server (None never
+        #                       prepares, which is needed behind transaction-pooling proxies such as pgbouncer)
+        #   on_connect          Called with each new DBAPI connection, e.g. to set up the session
+        # Anything else is passed on to create_engine
+        #
+        # If compress is set, object_contents are compressed with a dictionary per object_type, trained on the first
+        # objects of that type written. Only SQLite stores contents as blobs (Postgres compresses large JSONB itself).
+        # The contents can then only be queried by loading them, so query criteria are checked here rather than in
+        # the DB, and indexes are not created
+
         super().__init__(check_schema, allow_temporary_types)
         set_json_dumps(lambda x: x.decode() if isinstance(x, bytes) else x)
         set_json_loads(lambda x: x)
 
+        engine_kwargs.update({k: v for k, v in (("pool_size", pool_size),
+                                                ("max_overflow", max_overflow),
+                                                ("pool_timeout", pool_timeout),
+                                                ("pool_recycle", pool_recycle),
+                                                ("query_cache_size", query_cache_size)) if v is not None})
+
+        if make_url(connection_string).get_driver_name() == "psycopg":
+            engine_kwargs["connect_args"] = {"prepare_threshold": prepare_threshold,
+                                             **engine_kwargs.get("connect_args", {})}
+
         self.__existing_types: set[str] = set()
         self.__min_entry_time: datetime = datetime.max
         self.__id = None
-        self.__engine = create_engine(connection_string, echo=debug)
+        self.__engine = create_engine(connection_string, echo=debug, pool_pre_ping=pool_pre_ping, **engine_kwargs)
+        if compress and self.__engine.dialect.name != "sqlite":
+            raise ValueError(f"Compression is not supported on {self.__engine.dialect.name}")
+
+        self.__compress = compress
+        self.__dictionaries: dict[int, bytes] = {}
+        self.__type_dictionaries: dict[str, int] = {}
+        if on_connect:
+            event.listen(self.__engine, "connect", lambda dbapi_connection, _: on_connect(dbapi_connection))
+        self.__sessions = sessionmaker(self.__engine, class_=Session)
         self.__is_partitioned = self.__engine.dialect.name == "postgresql"
+        self.__read_query = self.__requested_json_query()
         self.__create_schema()
+        # Once a DB has compressed contents, they cannot be queried in the DB, whether or not we compress ourselves
+        self.__has_json_indexes = self.__engine.dialect.name in ("postgresql", "sqlite") and\
+            not (compress or self.__dictionaries)
 
-    def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
-        grouped_reads = {}
-
-        for r in reads.reads:
-            grouped_reads.setdefault((r.object_id_type, r.effective_time, r.entry_time), []).append(r.object_id)
-
-        with Session(self.__engine) as s:
-            while grouped_reads:
-                (object_id_type, effective_time, entry_time), object_ids = grouped_reads.popitem()
-
-                # Find the max version at or before the given times
-
-                subquery = s.query(ObjectRecord.object_id_type,
-                                   ObjectRecord.object_id,
-                                   func.max(ObjectRecord.effective_version).label("effective_version"),
-                                   func.max(ObjectRecord.entry_version).label("entry_version")).filter(
-                    ObjectRecord.effective_time <= effective_time,
-                    ObjectRecord.entry_time <= entry_time,
-                    ObjectRecord.object_id_type == object_id_type,
-                    ObjectRecord.object_id.cast(String).in_(o.decode() for o in object_ids)).group_by(
-                        ObjectRecord.object_id_type, ObjectRecord.object_id).subquery()
-
-                # Load the contents corresponding to the max version
-
-                query = s.query(ObjectRecord).join(subquery, and_(
-                    ObjectRecord.object_id_type == subquery.c.object_id_type,
-                    ObjectRecord.object_id == subquery.c.object_id,
-                    ObjectRecord.effective_version == subquery.c.effective_version,
-                    ObjectRecord.entry_version == subquery.c.entry_version
-                ))
-
-                return query.all()
+    @property
+    def _max_concurrent_calls(self) -> int | None:
+        # A single connection shared between threads (as by MemoryStore) must only be used by one at a time
+        return 1 if isinstance(self.__engine.pool, StaticPool) else None
 
-    def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
+    def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
         records = ()
 
-        with Session(self.__engine) as s:
-            transaction = Transactions(username=writes.username, hostname=writes.hostname, comment=writes.comment)
-            s.add(transaction)
-            s.commit()
+        with self.__sessions() as s:
+            for start in range(0, len(reads.reads), self.__max_reads_per_query):
+                chunk = reads.reads[start:start + self.__max_reads_per_query]
+
+                if self.__read_query is None:
+                    records += tuple(s.scalars(self.__match_query(self.__requested_values(chunk))))
+                else:
+                    records += tuple(s.scalars(self.__read_query, {"reads": self.__requested_json(chunk)}))
+
+        return tuple(map(self.__decompressed, records))
+
+    def __requested_json(self, reads: Sequence[ObjectRecord]) -> str:
+        # Each read is passed as [type, id, effective_time, entry_time]. The id is passed as a string, rather than
+        # embedded JSON, so that it comes back byte for byte, and the times in the format the dialect stores them in
+
+        sep = " " if self.__engine.dialect.name == "sqlite" else "T"
+        return (b"[" + b",".join(
+            dumps([r.object_id_type, r.object_id.decode(),
+                   r.effective_time.isoformat(sep, "microseconds"),
+                   r.entry_time.isoformat(sep, "microseconds")]) for r in reads) + b"]").decode()
+
+    def __requested_json_query(self) -> Select | None:
+        # Compiling a VALUES clause with a row per read costs far more than running the query, so where the DB can
+        # unpack a JSON array, pass the reads as a single parameter. The statement is then the same for every batch
+        # and SQLAlchemy compiles it only once
+
+        reads = bindparam("reads", type_=String)
+
+        if self.__engine.dialect.name == "sqlite":
+            each = func.json_each(reads).table_valued("value")
+            requested = select(
+                func.json_extract(each.c.value, "$[0]").label("object_id_type"),
+                cast(func.json_extract(each.c.value, "$[1]"), BLOB).label("object_id"),
+                func.json_extract(each.c.value, "$[2]").label("effective_time"),
+                func.json_extract(each.c.value, "$[3]").label("entry_time")
+            ).subquery("requested")
+
+            return self.__match_query(requested)
+        elif self.__engine.dialect.name == "postgresql":
+            each = func.jsonb_array_elements(cast(reads, JSONB)).table_valued(column("value", JSONB))
+            requested = select(
+                each.c.value[0].astext.label("object_id_type"),
+                cast(each.c.value[1].astext, JSONB).label("object_id"),
+                cast(each.c.value[2].astext, DateTime).label("effective_time"),
+                cast(each.c.value[3].astext, DateTime).label("entry_time")
+            ).subquery("requested")
+
+            return self.__match_query(requested)
+
+        return None
+
+    @staticmethod
+    def __requested_values(reads: Sequence[ObjectRecord]) -> FromClause:
+        return values(
+            column("object_id_type", String),
+            column("object_id", ObjectRecord.__table__.c.object_id.type),
+            column("effective_time", DateTime),
+            column("entry_time", DateTime),
+            name="requested"
+        ).data([(r.object_id_type, r.object_id, r.effective_time, r.entry_time) for r in reads])
+
+    @staticmethod
+    def __match_query(requested: FromClause) -> Select:
+        # Join the objects against the requested (type, id, effective_time, entry_time) coordinates and pick the
+        # max version at or before the given times for each of them, so that every read is answered by one statement
+
+        rank = func.row_number().over(
+            partition_by=(requested.c.object_id_type, requested.c.object_id,
+                          requested.c.effective_time, requested.c.entry_time),
+            order_by=(ObjectRecord.effective_version.desc(), ObjectRecord.entry_version.desc())).label("rank")
+
+        matches = select(ObjectRecord, rank).join(requested, and_(
+            ObjectRecord.object_id_type == requested.c.object_id_type,
+            ObjectRecord.object_id == requested.c.object_id,
+            ObjectRecord.effective_time <= requested.c.effective_time,
+            ObjectRecord.entry_time <= requested.c.entry_time
+        )).subquery()
+
+        # The same version may answer several of the reads
+
+        latest = aliased(ObjectRecord, matches)
+        return select(latest).where(matches.c.rank == 1).distinct()
+
+    def _execute_exists(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        # Immutable objects have the one version, so look them up by id alone, without fetching their contents
+
+        ids_by_type: dict[str, list[bytes]] = {}
+        for read in reads.reads:
+            ids_by_type.setdefault(read.object_id_type, []).append(read.object_id)
+
+        columns = tuple(c for c in ObjectRecord.__table__.c if c.name != "object_contents")
+        records = ()
 
-            for record in writes.writes:
-                if record.object_store_id and record.object_store_id != self.__id:
-                    raise WrongStoreError(record.object_type, record.object_id)
+        with self.__engine.connect() as c:
+            for object_id_type, object_ids in ids_by_type.items():
+                for start in range(0, len(object_ids), self.__max_reads_per_query):
+                    rows = c.execute(select(*columns).where(
+                        ObjectRecord.object_id_type == object_id_type,
+                        ObjectRecord.object_id.in_(literal(i, ObjectRecord.__table__.c.object_id.type)
+                                                   for i in object_ids[start:start + self.__max_reads_per_query])))
 
-                self.__add_type(record.object_id_type, s)
+                    records += tuple(ObjectRecord.model_construct(**row._mapping) for row in rows)
 
-                record.transaction_id = transaction.id
-                record.entry_time = transaction.entry_time
-                record.effective_time = min(transaction.entry_time, record.effective_time)
-                record.object_store_id = self.__id
+        return records
 
-                s.add(record)
-                records += (record,)
+    def _execute_history(self, request: HistoryRequest) -> Iterable[ObjectRecord]:
+        return self.__stream(self.__history_query(request))
 
-            try:
-                s.commit()
-            except IntegrityError:
-                raise FailedUpdateError()
+    def _execute_scan(self, request: ScanRequest) -> Iterable[ObjectRecord]:
+        if not request.criteria or self.__has_json_indexes:
+            return self.__stream(self.__scan_query(request))
 
-            for record in records:
-                s.refresh(record)
+        # Without JSON support in the DB, apply the criteria here, and so the limit after them. Otherwise, a page of
+        # objects none of which match would look like the end of the scan to the caller
 
-        return records
+        records = self.__stream(self.__scan_query(request.model_copy(update={"limit": None})))
+        matching = (r for r in records if matches_criteria(r, request.criteria))
+        return matching if request.limit is None else islice(matching, request.limit)
 
-    def __add_type(self, object_id_type: str, session: Session):
-        if self.__is_partitioned and object_id_type not in SQLModel.metadata.tables:
-            partition_stmt = text(fr"""
-                CREATE TABLE IF NOT EXISTS "{object_id_type}"
-                PARTITION OF objects
-                FOR VALUES IN ('{object_id_type}')
-            """)
+    def __stream(self, query: Select) -> Iterable[ObjectRecord]:
+        # Stream the results, rather than fetching them all, so that memory use stays flat however many there are
 
-            session.execute(partition_stmt)
-            session.commit()
+        with self.__sessions() as s:
+            records = s.scalars(query, execution_options={"yield_per": self.__rows_per_fetch})
+            yield from map(self.__decompressed, records)
+
+    @staticmethod
+    def __history_query(request: HistoryRequest) -> Select:
+        # A range scan of the primary key (object_id_type, object_id, effective_version, entry_version), picking the
+        # latest entry at or before entry_time for each effective version. Corrections may move a version's
+        # effective_time, so the effective range is applied to the chosen entries
+
+        rank = func.row_number().over(
+            partition_by=ObjectRecord.effective_version,
+            order_by=ObjectRecord.entry_version.desc()).label("rank")
+
+        versions = select(ObjectRecord, rank).where(
+            ObjectRecord.object_id_type == request.object_id_type,
+            ObjectRecord.object_id == literal(request.object_id, ObjectRecord.__table__.c.object_id.type),
+            ObjectRecord.effective_version > request.after_version,
+            ObjectRecord.entry_time <= request.entry_time
+        ).subquery()
+
+        latest = aliased(ObjectRecord, versions)
+        return select(latest).where(
+            versions.c.rank == 1,
+            latest.effective_time >= request.effective_from,
+            latest.effective_time <= request.effective_to
+        ).order_by(latest.effective_version).limit(request.limit)
+
+    def __scan_query(self, request: ScanRequest) -> Select:
+        # Restricting object_id_type prunes all but the type's partition on Postgres, and the times are the leading
+        # columns of idx_objects_by_time. Pick the latest version of each object as of the given times, as for reads
+
+        rank = func.row_number().over(
+            partition_by=ObjectRecord.object_id,
+            order_by=(ObjectRecord.effective_version.desc(), ObjectRecord.entry_version.desc())).label("rank")
+
+        conditions = (
+            ObjectRecord.object_id_type == request.object_id_type,
+            ObjectRecord.effective_time <= request.effective_time,
+            ObjectRecord.entry_time <= request.entry_time
+        )
+
+        versions = select(ObjectRecord, rank).where(*conditions)
+
+        if request.after_object_id is not None:
+            versions = versions.where(ObjectRecord.object_id > literal(request.after_object_id,
+                                                                       ObjectRecord.__table__.c.object_id.type))
+
+        if request.criteria and self.__has_json_indexes:
+            # Use the indexes to find the objects with a matching version, then check their latest versions match too
+
+            matching = select(ObjectRecord.object_id).where(*conditions, *(
+                self.__json_field(ObjectRecord.object_contents, f) == self.__json_value(v)
+                for f, v in request.criteria.items()))
+
+            versions = versions.where(ObjectRecord.object_id.in_(matching))
+
+        versions = versions.subquery()
+        latest = aliased(ObjectRecord, versions)
+        query = select(latest).where(versions.c.rank == 1)
+
+        if request.criteria and self.__has_json_indexes:
+            query = query.where(*(self.__json_field(versions.c.object_contents, f) == self.__json_value(v)
+                                  for f, v in request.criteria.items()))
+
+        return query.order_by(latest.object_id).limit(request.limit)
+
+    def __json_field(self, contents: ColumnElement, field: str) -> ColumnElement:
+        # The path is rendered literally, rather than bound, so that the DB can match the expression to the index.
+        # Requests may not have been validated (e.g. if built with model_construct), so check the name again here
+        check_identifier(field)
+
+        if self.__engine.dialect.name == "sqlite":
+            return func.json_extract(cast(contents, Text), literal_column(f"'$.{field}'"))
+        else:
+            return contents.op("->")(literal_column(f"'{field}'"))
+
+    def __json_value(self, value: bytes) -> ColumnElement:
+        if self.__engine.dialect.name == "sqlite":
+            return func.json_extract(value.decode(), "$")
+        else:
+            return cast(value.decode(), JSONB)
+
+    def register_index(self, request: IndexRequest):
+        # Index expressions match those of __json_field. On Postgres, each type's partition is indexed separately
+
+        check_identifier(request.object_id_type)
+        for field in request.fields:
+            check_identifier(field)
+
+        if not self.__has_json_indexes:
+            return
+
+        self.__add_types((request.object_id_type,))
+
+        with self.__engine.begin() as c:
+            for field in request.fields:
+                if self.__is_partitioned:
+                    c.execute(text(fr"""
+                        CREATE INDEX IF NOT EXISTS "idx_{request.object_id_type}_{field}"
+                        ON "{request.object_id_type}" ((object_contents -> '{field}'))
+                    """))
+                else:
+                    c.execute(text(fr"""
+                        CREATE INDEX IF NOT EXISTS "idx_objects_{request.object_id_type}_{field}"
+                        ON objects (object_id_type, json_extract(CAST(object_contents AS TEXT), '$.{field}'))
+                    """))
 
-            SQLModel.metadata.reflect(self.__engine, only=(object_id_type,))
+    def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
+        for record in writes.writes:
+            if record.object_store_id and record.object_store_id != self.__id:
+                raise WrongStoreError(record.object_type, record.object_id)
+
+        self.__add_types(set(r.object_id_type for r in writes.writes))
+        if self.__compress:
+            self.__add_dictionaries(writes.writes)
+
+        # The transaction and all its objects are written in one DB transaction. The objects go in a single
+        # executemany, which SQLAlchemy batches into multi-row INSERT ... RETURNING statements, so we get the
+        # stored records back without refreshing each one
+
+        try:
+            with self.__engine.begin() as c:
+                transaction_id, entry_time = c.execute(insert(Transactions).values(
+                    username=writes.username,
+                    hostname=writes.hostname,
+                    comment=writes.comment
+                ).returning(Transactions.id, Transactions.entry_time)).one()
+
+                rows = c.execute(insert(ObjectRecord).returning(*ObjectRecord.__table__.c), [{
+                    "object_store_id": self.__id,
+                    "object_id": record.object_id,
+                    "object_contents": self.__compressed(record),
+                    "transaction_id": transaction_id,
+                    "object_id_type": record.object_id_type,
+                    "object_type": record.object_type,
+                    "effective_time": min(entry_time, record.effective_time),
+                    "entry_time": entry_time,
+                    "effective_version": record.effective_version,
+                    "entry_version": record.entry_version
+                } for record in writes.writes]).all()
+        except IntegrityError:
+            raise FailedUpdateError()
+
+        return tuple(self.__decompressed(ObjectRecord(**row._mapping)) for row in rows)
+
+    def __compressed(self, record: ObjectRecord) -> bytes:
+        if not self.__compress:
+            return record.object_contents
+
+        dictionary_id = self.__type_dictionaries[record.object_type]
+        return compress(record.object_contents, dictionary_id, self.__dictionaries[dictionary_id])
+
+    def __decompressed(self, record: ObjectRecord) -> ObjectRecord:
+        # Records loaded by a session are tracked by it, so return a copy rather than changing the contents in place
+        # (which a flush would write back)
+
+        if not is_compressed(record.object_contents):
+            return record
+
+        return ObjectRecord.model_construct(**{
+            **{c.name: getattr(record, c.name) for c in ObjectRecord.__table__.c},
+            "object_contents": decompress(record.object_contents, self.__dictionary)
+        })
+
+    def __dictionary(self, dictionary_id: int) -> bytes:
+        if dictionary_id not in self.__dictionaries:
+            # Added by another process since we last looked
+            with self.__engine.connect() as c:
+                self.__load_dictionaries(c)
+
+        return self.__dictionaries[dictionary_id]
+
+    def __add_dictionaries(self, records: Sequence[ObjectRecord]):
+        # Train a dictionary for each type not seen before on its objects in this batch, in a separate short
+        # transaction, as for partitions. Should another process add one for the same type at the same time, each
+        # uses its own, as compressed contents record the dictionary they need
+
+        missing = set(r.object_type for r in records) - self.__type_dictionaries.keys()
+        if missing:
+            with self.__engine.begin() as c:
+                self.__load_dictionaries(c)
+
+                for object_type in sorted(missing - self.__type_dictionaries.keys()):
+                    dictionary = train_dictionary(r.object_contents for r in records if r.object_type == object_type)
+                    dictionary_id = c.execute(insert(Dictionaries).values(
+                        object_type=object_type,
+                        codec=CODEC,
+                        dictionary=dictionary
+                    ).returning(Dictionaries.id)).scalar_one()
+
+                    self.__dictionaries[dictionary_id] = dictionary
+                    self.__type_dictionaries[object_type] = dictionary_id
+
+    def __load_dictionaries(self, connection: Connection):
+        for dictionary_id, object_type, codec, dictionary in connection.execute(
+                select(Dictionaries.id, Dictionaries.object_type, Dictionaries.codec, Dictionaries.dictionary)
+                .order_by(Dictionaries.id)):
+            if codec != CODEC:
+                raise ValueError(f"Unsupported codec {codec}")
+
+            self.__dictionaries[dictionary_id] = dictionary
+            self.__type_dictionaries[object_type] = dictionary_id
+
+    def __add_types(self, object_id_types: Iterable[str]):
+        # Create the partitions for any types not already known to exist, all in one short DDL transaction. It is
+        # kept separate from the writes, as creating a partition locks objects until the transaction commits
+
+        missing = set(object_id_types) - self.__existing_types if self.__is_partitioned else ()
+        if missing:
+            for object_id_type in missing:
+                check_identifier(object_id_type)
+
+            with self.__engine.begin() as c:
+                for object_id_type in sorted(missing):
+                    c.execute(text(fr"""
+                        CREATE TABLE IF NOT EXISTS "{object_id_type}"
+                        PARTITION OF objects
+                        FOR VALUES IN ('{object_id_type}')
+                    """))
+
+            self.__existing_types.update(missing)
+
+    def __discover_types(self, connection: Connection):
+        # Find the existing partitions once, at startup, rather than checking for them on each write
+
+        if self.__is_partitioned:
+            self.__existing_types.update(connection.execute(text("""
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+                JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+                WHERE parent.relname = 'objects'
+            """)).scalars())
 
     def __create_schema(self):
         SQLModel.metadata.create_all(self.__engine)
 
-        with Session(self.__engine) as s:
+        with self.__engine.connect() as c:
+            self.__discover_types(c)
+            self.__load_dictionaries(c)
+
+        with self.__sessions() as s:
             self.__min_entry_time = next(iter(s.exec(select(func.min(Transactions.entry_time))).first())) or\
                                     datetime.max
 
@@ -135,18 +506,52 @@ class SqlStore(ObjectStore):
                 self.__id = next(iter(s.exec(select(Id.id)).first()))
 
 
+def _tune_sqlite(dbapi_connection, journal_mode: str = "WAL", synchronous: str = "NORMAL"):
+    # Write-ahead logging lets readers, including those in other processes, carry on while a write is in progress,
+    # and, with synchronous=NORMAL, commits need not wait for the disk (the DB stays consistent, but the last
+    # transactions may be lost on power failure). Memory-map the file and keep more pages, and temporary tables, in
+    # memory
+
+    cursor = dbapi_connection.cursor()
+    for pragma in (f"journal_mode = {journal_mode}",
+                   f"synchronous = {synchronous}",
+                   f"mmap_size = {256 * 1024 * 1024}",
+                   f"cache_size = -{64 * 1024}",
+                   "temp_store = MEMORY"):
+        cursor.execute(f"PRAGMA {pragma}")
+
+    cursor.close()
+
+
+def _tune_temp_sqlite(dbapi_connection):
+    # A temporary DB is used by the one process and thrown away, so there is nothing to gain from WAL (which would
+    # leave -wal and -shm files behind), nor from syncing to the disk
+    _tune_sqlite(dbapi_connection, journal_mode="MEMORY", synchronous="OFF")
+
+
 class LocalStore(SqlStore):
-    def __init__(self, filename: str, debug: bool = False):
-        super().__init__(f"sqlite:///{filename}", False, True, debug=debug)
+    def __init__(self,
+                 filename: str,
+                 debug: bool = False,
+                 tuned: bool = True,
+                 compress: bool = False,
+                 **engine_options):
+        # Unless tuned is False, SQLite is set up for speed over durability on power failure, see _tune_sqlite
+        engine_options.setdefault("on_connect", _tune_sqlite if tuned else None)
+        super().__init__(f"sqlite:///{filename}", False, True, debug=debug, compress=compress, **engine_options)
 
 
 class TempStore(LocalStore):
-    def __init__(self, debug: bool = False):
+    def __init__(self, debug: bool = False, tuned: bool = True, compress: bool = False, **engine_options):
         self.__file = NamedTemporaryFile()
         atexit.register(lambda f: f.close(), self.__file)
-        super().__init__(self.__file.name, debug=debug)
+        super().__init__(self.__file.name, debug=debug, tuned=tuned, compress=compress,
+                         on_connect=_tune_temp_sqlite if tuned else None, **engine_options)
 
 
 class MemoryStore(SqlStore):
-    def __init__(self, debug: bool = False):
-        super().__init__("sqlite+pysqlite:///:memory:", False, True, debug=debug)
+    def __init__(self, debug: bool = False, **engine_options):
+        # Each connection to :memory: gets its own DB, so share the one connection between all threads. Hence, the
+        # pool size options do not apply
+        super().__init__("sqlite+pysqlite:///:memory:", False, True, debug=debug,
+                         poolclass=StaticPool, connect_args={"check_same_thread": False}, **engine_options)
@@ -1,36 +1,139 @@
-from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from heapq import merge
+from itertools import chain, islice
+from time import monotonic
 from typing import Iterable
 
 from .object_record import ObjectRecord
-from .object_store import ObjectStore, ReadRequest, RegisterSchemaRequest, WriteRequest
+from .object_store import (
+    HistoryRequest, IndexRequest, ObjectStore, ReadRequest, RegisterSchemaRequest, ScanRequest, WriteRequest,
+    match_reads, matches_criteria, read_key
+)
 
 
 class UnionStore(ObjectStore):
-    def __init__(self, stores: Iterable[ObjectStore]):
+    # Number of objects scanned at a time, before looking them up in the other stores
+    __scan_batch_size = 1000
+
+    def __init__(self, stores: Iterable[ObjectStore], timeout: float | None = None, return_early: bool = False):
+        # stores are in priority order and writes go to the first. Stores which do not answer a batch of reads
+        # within timeout seconds are ignored for that batch. With return_early, we stop waiting for lower-priority
+        # stores once the higher-priority ones have answered every read
+
         assert stores
 
         self.__stores = tuple(stores)
         self.__write_store = self.__stores[0]
+        self.__timeout = timeout
+        self.__return_early = return_early
+        # Each store has its own worker, so that one which hangs holds up no others. Its calls which time out cannot
+        # be cancelled once running, so until they finish the store is skipped, rather than queueing more behind them
+        self.__executors = tuple(ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"UnionStore{i}")
+                                 for i in range(len(self.__stores)))
+        self.__timed_out: dict[int, Future] = {}
 
         super().__init__(self.__write_store.check_schema, self.__write_store.allow_temporary_types)
 
+    @property
+    def _max_concurrent_calls(self) -> int | None:
+        # The most restrictive of the stores', as each call may use all of them
+        return min((n for n in (s._max_concurrent_calls for s in self.__stores) if n is not None), default=None)
+
     def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
-        # ToDo: make this parallel with async
-        results = [store._execute_reads(reads) for store in self.__stores]
-        grouped_results = {}
-        ret = tuple()
+        # Query the stores concurrently, so that latency is that of the slowest store, rather than the sum
+
+        requested = set((r.object_id_type, r.object_id) for r in reads.reads)
+        answered = set()
+        results = []
+
+        for _idx, result in self.__results(lambda store: store._execute_reads(reads)):
+            results.append(result)
+
+            if self.__return_early:
+                answered.update((r.object_id_type, r.object_id) for r in result)
+                if answered >= requested:
+                    break
+
+        if not results:
+            raise TimeoutError(f"No store answered within {self.__timeout}s")
+
+        # Find the most recent for each read, across all the stores. On a tie, the higher-priority store wins
+        return tuple({id(r): r for r in match_reads(reads.reads, chain.from_iterable(results)).values()}.values())
+
+    def __results(self, call, skip: int | None = None) -> Iterable[tuple[int, Iterable[ObjectRecord]]]:
+        # Make the call on each store but skip, concurrently, yielding the results of those which answer within the
+        # timeout, in priority order. Stores which time out, or have yet to finish a call which did, are left out
+
+        deadline = None if self.__timeout is None else monotonic() + self.__timeout
+        futures = [(idx, self.__executors[idx].submit(call, store))
+                   for idx, store in enumerate(self.__stores) if idx != skip and not self.__is_hung(idx)]
+
+        for idx, future in futures:
+            try:
+                result = future.result(timeout=None if deadline is None else max(0., deadline - monotonic()))
+            except TimeoutError:
+                if not future.cancel():
+                    self.__timed_out[idx] = future
 
-        for r in chain.from_iterable(results):
-            grouped_results.setdefault((r.object_id_type, r.object_id), []).append(r)
+                continue
 
-        # Find the most recent for each type/id
-        for all_store_results in grouped_results.values():
-            ret += (sorted(all_store_results, key=lambda i: (i.effective_time, i.entry_time))[-1],)
+            yield idx, result
 
-        return ret
+    def __is_hung(self, idx: int) -> bool:
+        future = self.__timed_out.get(idx)
+        if future is None:
+            return False
+        elif future.done():
+            self.__timed_out.pop(idx, None)
+            return False
+
+        return True
+
+    def _execute_exists(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        # Writes go to the write store, so an object is only persisted if it is there
+        return self.__write_store._execute_exists(reads)
+
+    def _execute_history(self, request: HistoryRequest) -> Iterable[ObjectRecord]:
+        # Interleave the stores' histories by effective time. Each store streams its own, so this stays lazy too.
+        # On a tie, the higher-priority store comes first
+
+        histories = merge(*(store._execute_history(request) for store in self.__stores),
+                          key=lambda r: r.effective_time)
+        return histories if request.limit is None else islice(histories, request.limit)
+
+    def _execute_scan(self, request: ScanRequest) -> Iterable[ObjectRecord]:
+        # Scan each store in turn. An object may be in several of them, so look up each batch in the others, skipping
+        # objects found in a higher-priority store (we returned those when scanning it) and otherwise returning the
+        # most recent version across all the stores, if it still matches. This keeps memory use flat, at the cost of
+        # extra reads. Stores which do not answer a lookup within the timeout are ignored for that batch
+
+        def scan():
+            for idx, store in enumerate(self.__stores):
+                records = iter(store._execute_scan(request))
+
+                while batch := tuple(islice(records, self.__scan_batch_size)):
+                    reads = tuple(ObjectRecord.model_construct(object_id_type=r.object_id_type,
+                                                               object_id=r.object_id,
+                                                               effective_time=request.effective_time,
+                                                               entry_time=request.entry_time) for r in batch)
+
+                    request_reads = ReadRequest(reads=reads)
+                    others = tuple(self.__results(lambda s: tuple(s._execute_reads(request_reads)), skip=idx))
+                    higher = [r for i, r in others if i < idx]
+                    lower = [r for i, r in others if i > idx]
+
+                    seen = match_reads(reads, chain.from_iterable(higher)).keys()
+                    latest = match_reads(reads, chain(chain.from_iterable(higher), batch, chain.from_iterable(lower)))
+                    yield from (latest[k] for k in map(read_key, reads)
+                                if k not in seen and matches_criteria(latest[k], request.criteria))
+
+        return scan() if request.limit is None else islice(scan(), request.limit)
 
     def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
         return self.__write_store._execute_writes(writes)
 
+    def register_index(self, request: IndexRequest):
+        self.__write_store.register_index(request)
+
     def register_schema(self, request: RegisterSchemaRequest):
         self.__write_store.register_schema(request)
@@ -1,31 +1,99 @@
+from gzip import compress
+from orjson import loads
 from pydantic import BaseModel
-from requests import Session, codes
-from typing import Iterable
+from requests import Response, Session, codes
+from typing import Any, Callable, Iterable
 
-from .._json import dumps, loads
+from .._json import dumps
 
 from .object_record import ObjectRecord
-from .object_store import ObjectStore, ReadRequest, RegisterSchemaRequest, WriteRequest
+from .object_store import (
+    HistoryRequest, IndexRequest, ObjectStore, ReadRequest, RegisterSchemaRequest, ScanRequest, WriteRequest,
+    _validate_records
+)
+from .wire import MEDIA_TYPE, can_dump_request, dump_request, load_records
 
 
 class WebStoreClient(ObjectStore):
-    def __init__(self, base_url: str):
+    # Number of records fetched per request by history and scan
+    __page_size = 1000
+    # Request bodies at least this big are sent compressed, if compress is set
+    __min_compressed_size = 1024
+
+    def __init__(self, base_url: str, compress: bool = True, binary: bool = True):
+        # The server compresses its responses if we accept gzip, which requests does by default. Unless binary is
+        # False, records are sent and received in the encoding of wire.py, rather than as JSON
         super().__init__(False, False)
         self.__base_url = base_url
+        self.__compress = compress
+        self.__binary = binary
         self.__session = Session()
 
     def _execute_reads(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
-        return self.__post("read", reads)
+        return self.__records("read", reads)
 
     def _execute_writes(self, writes: WriteRequest) -> Iterable[ObjectRecord]:
-        return self.__post("write", writes)
+        return self.__records("write", writes)
+
+    def _execute_exists(self, reads: ReadRequest) -> Iterable[ObjectRecord]:
+        return self.__records("exists", reads)
+
+    def _execute_history(self, request: HistoryRequest) -> Iterable[ObjectRecord]:
+        return self.__pages("history", request, "after_version", lambda r: r.effective_version)
+
+    def _execute_scan(self, request: ScanRequest) -> Iterable[ObjectRecord]:
+        return self.__pages("scan", request, "after_object_id", lambda r: r.object_id)
+
+    def __pages(self,
+                endpoint: str,
+                request: HistoryRequest | ScanRequest,
+                cursor: str,
+                cursor_value: Callable[[ObjectRecord], Any]) -> Iterable[ObjectRecord]:
+        # Fetch a page at a time, carrying on from the last record received, so that neither we nor the server
+        # hold all the results at once. The server may return less than we ask for, so only an empty page marks
+        # the end
+
+        remaining = request.limit
+
+        while remaining is None or remaining > 0:
+            page_size = self.__page_size if remaining is None else min(remaining, self.__page_size)
+            page = self.__records(endpoint, request.model_copy(update={"limit": page_size}))
+            if not page:
+                break
+
+            yield from page
+
+            request = request.model_copy(update={cursor: cursor_value(page[-1])})
+            remaining = None if remaining is None else remaining - len(page)
+
+    def register_index(self, request: IndexRequest):
+        self.__post("register_index", request)
 
     def register_schema(self, json_schema: RegisterSchemaRequest):
         self.__post("register", json_schema)
 
-    def __post(self, endpoint: str, request: BaseModel):
-        result = self.__session.post(f"{self.__base_url}/{endpoint}", data=dumps(request))
+    def __records(self, endpoint: str, request: BaseModel) -> tuple[ObjectRecord, ...]:
+        result = self.__post(endpoint, request)
+
+        if result.headers.get("Content-Type") == MEDIA_TYPE:
+            return load_records(result.content)[0]
+        else:
+            return _validate_records(loads(result.content))
+
+    def __post(self, endpoint: str, request: BaseModel) -> Response:
+        if self.__binary and can_dump_request(request):
+            data = dump_request(request)
+            headers = {"Content-Type": MEDIA_TYPE, "Accept": MEDIA_TYPE}
+        else:
+            data = dumps(request)
+            headers = {"Content-Type": "application/json", **({"Accept": MEDIA_TYPE} if self.__binary else {})}
+
+        if self.__compress and len(data) >= self.__min_compressed_size:
+            data = compress(data, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        result = self.__session.post(f"{self.__base_url}/{endpoint}/", data=data, headers=headers)
         if result.status_code == codes.ok:
-            return tuple(ObjectRecord(**r) for r in loads(result.content))
+            return result
         else:
             result.raise_for_status()
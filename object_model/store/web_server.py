@@ -1,30 +1,227 @@
-from fastapi import FastAPI
-from typing import Iterable
+from argparse import ArgumentParser
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from inspect import signature
+from os import environ
+from pydantic import ValidationError
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Callable, Coroutine, Iterable, TypeVar
 import uvicorn
+from zlib import MAX_WBITS, decompressobj, error as ZlibError
 
 from object_model.store.object_record import ObjectRecord
-from object_model.store.object_store import ReadRequest, RegisterSchemaRequest, WriteRequest
-from object_model.store import MemoryStore
+from object_model.store.object_store import (
+    HistoryRequest, IndexRequest, ObjectStore, ReadRequest, RegisterSchemaRequest, ScanRequest, WriteRequest
+)
+from object_model.store import MemoryStore, SqlStore
+from object_model.store.wire import MEDIA_TYPE, dump_records, load_request
+
+
+# Configured from the environment, so that each uvicorn worker process creates its store the same way:
+#   OBJECT_STORE_CONNECTION_STRING  SQLAlchemy URL of the DB (an in-memory DB if not set)
+#   OBJECT_STORE_POOL_SIZE          Number of DB connections held by each worker process
+#   OBJECT_STORE_MAX_THREADS        Number of store calls each worker process runs concurrently
+#   OBJECT_STORE_CHECK_SCHEMA       Validate writes against the registered schemas if set to 1
+#   OBJECT_STORE_PAGE_SIZE          Maximum number of records returned by each call to history or scan
+#   OBJECT_STORE_MAX_BODY_SIZE      Maximum size in bytes of a decompressed request body
+
+T = TypeVar("T")
+
+connection_string = environ.get("OBJECT_STORE_CONNECTION_STRING")
+pool_size = int(environ.get("OBJECT_STORE_POOL_SIZE", 5))
+# An in-memory DB has just the one connection, so calls to it cannot run concurrently
+max_threads = int(environ.get("OBJECT_STORE_MAX_THREADS", pool_size)) if connection_string else 1
+check_schema = environ.get("OBJECT_STORE_CHECK_SCHEMA") == "1"
+page_size = int(environ.get("OBJECT_STORE_PAGE_SIZE", 1000))
+max_body_size = int(environ.get("OBJECT_STORE_MAX_BODY_SIZE", 256 * 1024 * 1024))
+
+
+def create_store() -> ObjectStore:
+    if not connection_string:
+        return MemoryStore()
+
+    # Allow enough connections for every thread, and check them, as the server is long-running
+    return SqlStore(connection_string,
+                    check_schema=check_schema,
+                    allow_temporary_types=True,
+                    pool_size=pool_size,
+                    max_overflow=max(0, max_threads - pool_size),
+                    pool_pre_ping=True)
+
+
+class GUnzipMiddleware:
+    # Decompresses request bodies sent with Content-Encoding: gzip, as WebStoreClient sends large writes. The body is
+    # decompressed as it arrives, up to max_body_size, so that a small request cannot expand to fill the memory
+
+    def __init__(self, app: ASGIApp, max_size: int = max_body_size):
+        self.__app = app
+        self.__max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        headers = dict(scope.get("headers", ())) if scope["type"] == "http" else {}
+        if headers.get(b"content-encoding") != b"gzip":
+            return await self.__app(scope, receive, send)
+
+        try:
+            body = await self.__decompress(receive)
+        except ZlibError as e:
+            response = JSONResponse({"detail": f"Invalid gzip request body: {e}"}, status_code=400)
+            return await response(scope, receive, send)
+
+        if body is None:
+            response = JSONResponse({"detail": f"Request body exceeds {self.__max_size} bytes"}, status_code=413)
+            return await response(scope, receive, send)
+
+        headers.pop(b"content-encoding")
+        headers[b"content-length"] = str(len(body)).encode()
+        received = False
+
+        async def receive_body() -> Message:
+            nonlocal received
+            if received:
+                return await receive()
+
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.__app({**scope, "headers": list(headers.items())}, receive_body, send)
+
+    async def __decompress(self, receive: Receive) -> bytes | None:
+        # The decompressed body, or None if it is larger than the maximum size
+        chunks = []
+        size = 0
+        # 16 + MAX_WBITS expects a gzip header and trailer
+        decompressor = decompressobj(16 + MAX_WBITS)
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            data = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            while data:
+                chunk = decompressor.decompress(data, self.__max_size + 1 - size)
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.__max_size:
+                    return None
+
+                data = decompressor.unconsumed_tail
+                if decompressor.eof and decompressor.unused_data:
+                    # The next member of a multi-member gzip body
+                    data = decompressor.unused_data
+                    decompressor = decompressobj(16 + MAX_WBITS)
+
+        if not decompressor.eof:
+            raise ZlibError("incomplete gzip body")
+
+        return b"".join(chunks)
+
+
+class RecordsRoute(APIRoute):
+    # Requests with records may also be sent, and records returned, in the binary encoding of wire.py, as negotiated
+    # by the Content-Type and Accept headers. Otherwise, FastAPI handles the JSON as usual
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[None, None, Response]]:
+        handler = super().get_route_handler()
+        request_type = next(iter(signature(self.endpoint).parameters.values())).annotation
+
+        async def route_handler(request: Request) -> Response:
+            binary_request = request.headers.get("content-type") == MEDIA_TYPE
+            binary_response = MEDIA_TYPE in request.headers.get("accept", "")
+
+            if not (binary_request or binary_response):
+                return await handler(request)
+
+            body = await request.body()
+
+            try:
+                parsed = load_request(request_type, body) if binary_request else\
+                    request_type.model_validate_json(body)
+            except ValidationError as e:
+                raise RequestValidationError(e.errors(), body=body)
+            except ValueError as e:
+                # A malformed binary message
+                raise RequestValidationError([{"type": "value_error", "loc": ("body",), "msg": str(e), "input": None}],
+                                             body=body)
+
+            result = await self.endpoint(parsed)
+
+            if binary_response and result is not None:
+                return Response(dump_records(result), media_type=MEDIA_TYPE)
+            else:
+                return JSONResponse(jsonable_encoder(result))
+
+        return route_handler
 
 
 app = FastAPI()
-db = MemoryStore()  # Use the actual DB here
+app.router.route_class = RecordsRoute
+# Responses are mostly records of the same few types, so compress well. Each is compressed as a whole, so the keys
+# repeated between records cost little
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+app.add_middleware(GUnzipMiddleware)
+db = create_store()
+
+# Store calls block, so run them on a bounded pool of threads rather than on the event loop
+executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="ObjectStore")
+
+
+async def run_in_executor(fn: Callable[..., T], *args) -> T:
+    return await get_running_loop().run_in_executor(executor, fn, *args)
 
 
 @app.post("/read/")
 async def read(request: ReadRequest) -> Iterable[ObjectRecord]:
-    return db._execute_reads(request)
+    return await run_in_executor(db._execute_reads, request)
 
 
 @app.post("/write/")
 async def write(request: WriteRequest) -> Iterable[ObjectRecord]:
-    return db._execute_writes_with_check(request)
+    return await run_in_executor(db._execute_writes_with_check, request)
+
+
+@app.post("/exists/")
+async def exists(request: ReadRequest) -> Iterable[ObjectRecord]:
+    return await run_in_executor(db._execute_exists, request)
+
+
+def page(request: HistoryRequest | ScanRequest) -> HistoryRequest | ScanRequest:
+    # Return at most a page of records. Clients fetch the rest by passing the last one received as the cursor
+    return request.model_copy(update={"limit": page_size if request.limit is None else min(request.limit, page_size)})
+
+
+@app.post("/history/")
+async def history(request: HistoryRequest) -> Iterable[ObjectRecord]:
+    return await run_in_executor(tuple, db._execute_history(page(request)))
+
+
+@app.post("/scan/")
+async def scan(request: ScanRequest) -> Iterable[ObjectRecord]:
+    return await run_in_executor(tuple, db._execute_scan(page(request)))
 
 
 @app.post("/register/")
 async def register(request: RegisterSchemaRequest):
-    db.register_schema(request)
+    await run_in_executor(db.register_schema, request)
+
+
+@app.post("/register_index/")
+async def register_index(request: IndexRequest):
+    await run_in_executor(db.register_index, request)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app)
+    parser = ArgumentParser(description="Serve an object store over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+
+    uvicorn.run("object_model.store.web_server:app", host=args.host, port=args.port, workers=args.workers)
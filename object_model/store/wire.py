@@ -0,0 +1,129 @@
+from datetime import datetime
+from functools import cache
+from orjson import dumps, loads
+from pydantic import BaseModel, NonNegativeInt
+from struct import Struct, error as StructError
+from typing import Any, Iterable, TypeVar
+from uuid import UUID
+
+from .object_record import ObjectRecord
+
+# A binary encoding of records, for the web protocol. A message is the length of a JSON header, the header and then
+# each record's object_id and object_contents, as they are. The header holds the request's other fields and, for each
+# record, its remaining columns and the lengths of its id and contents. Hence, the contents are not escaped inside
+# JSON strings, and records are built without validating each one. Messages received from untrusted clients (i.e.
+# by the server) have their header validated, in one go, and must be exactly as long as it says
+
+MEDIA_TYPE = "application/x-object-records"
+
+T = TypeVar("T", bound=BaseModel)
+
+__length = Struct(">I")
+
+
+class _Header(BaseModel):
+    fields: dict[str, Any]
+    # object_store_id, transaction_id, object_id_type, object_type, effective_time, entry_time, effective_version,
+    # entry_version and the lengths of object_id and object_contents
+    records: list[tuple[UUID | None, int, str, str, datetime, datetime, int, int, NonNegativeInt, NonNegativeInt]]
+
+
+@cache
+def _records_field(typ: type[BaseModel]) -> str | None:
+    return next((n for n, f in typ.model_fields.items() if f.annotation == tuple[ObjectRecord, ...]), None)
+
+
+def dump_records(records: Iterable[ObjectRecord], **fields) -> bytes:
+    headers = []
+    blobs = []
+
+    for r in records:
+        headers.append((
+            None if r.object_store_id is None else str(r.object_store_id),
+            r.transaction_id,
+            r.object_id_type,
+            r.object_type,
+            r.effective_time,
+            r.entry_time,
+            r.effective_version,
+            r.entry_version,
+            len(r.object_id),
+            len(r.object_contents)
+        ))
+        blobs.append(r.object_id)
+        blobs.append(r.object_contents)
+
+    header = dumps({"fields": fields, "records": headers})
+    return b"".join((__length.pack(len(header)), header, *blobs))
+
+
+def load_records(data: bytes, validate: bool = False) -> tuple[tuple[ObjectRecord, ...], dict[str, Any]]:
+    # Raises ValueError (or its subclass, ValidationError) if the message is malformed
+
+    try:
+        header_length, = __length.unpack_from(data)
+    except StructError:
+        raise ValueError("Message too short for its header length")
+
+    offset = __length.size + header_length
+
+    if validate:
+        header = _Header.model_validate_json(data[__length.size:offset])
+        fields, rows = header.fields, header.records
+    else:
+        header = loads(memoryview(data)[__length.size:offset])
+        fields, rows = header["fields"], header["records"]
+
+    store_ids: dict[str, UUID] = {}
+    records = []
+
+    for (object_store_id, transaction_id, object_id_type, object_type, effective_time, entry_time,
+         effective_version, entry_version, id_length, contents_length) in rows:
+        if not validate:
+            effective_time = datetime.fromisoformat(effective_time)
+            entry_time = datetime.fromisoformat(entry_time)
+
+            if object_store_id is not None:
+                if object_store_id not in store_ids:
+                    store_ids[object_store_id] = UUID(object_store_id)
+
+                object_store_id = store_ids[object_store_id]
+
+        object_id = data[offset:offset + id_length]
+        offset += id_length
+        object_contents = data[offset:offset + contents_length]
+        offset += contents_length
+
+        records.append(ObjectRecord.model_construct(
+            object_store_id=object_store_id,
+            object_id=object_id,
+            object_contents=object_contents,
+            transaction_id=transaction_id,
+            object_id_type=object_id_type,
+            object_type=object_type,
+            effective_time=effective_time,
+            entry_time=entry_time,
+            effective_version=effective_version,
+            entry_version=entry_version
+        ))
+
+    if validate and offset != len(data):
+        raise ValueError(f"Message is {len(data)} bytes long but its header accounts for {offset}")
+
+    return tuple(records), fields
+
+
+def can_dump_request(request: BaseModel) -> bool:
+    return _records_field(type(request)) is not None
+
+
+def dump_request(request: BaseModel) -> bytes:
+    field = _records_field(type(request))
+    return dump_records(getattr(request, field), **request.model_dump(mode="json", exclude={field}))
+
+
+def load_request(typ: type[T], data: bytes) -> T:
+    # Requests come from clients, so are validated: the records' header and the request's other fields
+    field = _records_field(typ)
+    records, fields = load_records(data, validate=True)
+    return typ.model_validate({**fields, field: ()}).model_copy(update={field: records})
@@ -1,6 +1,8 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import ClassVar
 
-from object_model import Id, PersistableModel
+from object_model import Id, Immutable, ImmutableModel, PersistableModel
 
 
 def test_id():
@@ -83,3 +85,57 @@ def test_multiple_persistable_bases():
         assert True
     else:
         assert False
+
+
+def test_content_hash():
+    class HashedQuote(ImmutableModel):
+        ticker: str
+        price: float
+        source: str = "exchange"
+
+    class HashedSnapshot(ImmutableModel):
+        as_of: datetime
+        quotes: tuple[HashedQuote, ...]
+        extras: dict[str, float | int] = {}
+
+    @dataclass(frozen=True)
+    class HashedQuoteDC(Immutable):
+        ticker: str
+        price: float
+
+    class Sha3Quote(ImmutableModel):
+        content_hash_algorithm: ClassVar[str] = "sha3_512"
+        ticker: str
+
+    quote = HashedQuote(ticker="foo", price=1.)
+
+    # Equal objects hash the same however they were made: defaults given or not, dicts in any order, whole numbers
+    # as ints or floats, and times in any zone
+    assert quote.content_hash == HashedQuote(ticker="foo", price=1, source="exchange").content_hash
+    assert quote.content_hash != HashedQuote(ticker="foo", price=1.5).content_hash
+    assert quote.content_hash != HashedQuoteDC(ticker="foo", price=1.).content_hash
+
+    as_of = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+    snapshot = HashedSnapshot(as_of=as_of, quotes=(quote,), extras={"a": 1, "b": 2.})
+    assert snapshot.content_hash == HashedSnapshot(as_of=as_of.astimezone(timezone(timedelta(hours=5))),
+                                             quotes=(HashedQuote(ticker="foo", price=1.),),
+                                             extras={"b": 2, "a": 1.}).content_hash
+
+    # The quotes' own hashes are used, rather than serialising them again
+    assert "object_contents" not in quote.__dict__
+    assert snapshot.object_id == f'["{snapshot.content_hash}"]'.encode()
+
+    assert HashedQuoteDC(ticker="foo", price=1.).content_hash == HashedQuoteDC(ticker="foo", price=1).content_hash
+    assert len(Sha3Quote(ticker="foo").content_hash) == 128
+    assert len(quote.content_hash) == 64
+
+    try:
+        class BadlyHashed(ImmutableModel):
+            content_hash_algorithm: ClassVar[str] = "md5"
+            ticker: str
+
+        _ = BadlyHashed
+    except TypeError:
+        assert True
+    else:
+        assert False
@@ -4,6 +4,9 @@ from jsonschema.exceptions import ValidationError
 from orjson import loads
 
 from object_model._json import dumps, schema
+from object_model.store import SqlStore
+from object_model.store.object_record import ObjectRecord
+from object_model.store.object_store import WriteRequest
 from .shared_pydantic_types import Container2, Nested, Outer
 
 
@@ -22,3 +25,40 @@ def test_json_schema_validation():
         assert True
     else:
         assert False
+
+
+def test_store_schema_validation():
+    c = Container2(name="container", contents={"foo": 1}, rank=1)
+    o = Outer(name="outer", the_nested=Nested(name="nested", container=c), date=date(1970, 1, 1))
+
+    db = SqlStore("sqlite+pysqlite:///:memory:", check_schema=True, allow_temporary_types=True)
+    db.register_type(Outer)
+
+    def write(contents: bytes, object_type: str = o.object_type):
+        record = ObjectRecord(object_type=object_type,
+                              object_id_type=o.object_id_type,
+                              object_id=o.object_id,
+                              object_contents=contents,
+                              effective_version=1,
+                              entry_version=1)
+
+        return db._execute_writes_with_check(WriteRequest(writes=(record,), username="", hostname="", comment=""))
+
+    as_dict = loads(dumps(o))
+    del as_dict["theNested"]
+
+    try:
+        write(dumps(as_dict))
+    except ValidationError:
+        assert True
+    else:
+        assert False
+
+    assert write(dumps(o))
+
+    try:
+        write(dumps(c), object_type="Unknown")
+    except RuntimeError:
+        assert True
+    else:
+        assert False
@@ -1,7 +1,27 @@
-from datetime import date
-from time import sleep
-
-from object_model.store import FailedUpdateError, MemoryStore, UnionStore, WrongStoreError
+from asyncio import gather, run
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from os import listdir
+from pytest import raises
+from sqlite3 import connect
+from tempfile import gettempdir
+from time import monotonic, sleep
+from typing import ClassVar
+
+from object_model import ImmutableModel, Index, NamedPersistableModel
+from object_model.store import (
+    CachingStore,
+    FailedUpdateError,
+    LazyObject,
+    LocalStore,
+    MemoryStore,
+    NotFoundError,
+    TempStore,
+    UnionStore,
+    WrongStoreError,
+    precompute_serialisation
+)
+from object_model.store.object_store import IndexRequest, ScanRequest
 
 from .shared_pydantic_types import Container, Container2, Container3, Nested, Outer
 
@@ -39,6 +59,11 @@ def test_update():
     assert o_v1.effective_version == 1
     assert o_v1.the_version == 0
 
+    # Times in any zone are as good as naive UTC ones
+    assert db.read(Storable, "outer", effective_time=o.effective_time.replace(tzinfo=timezone.utc)).value == o
+    assert db.read(Storable, "outer", effective_time=datetime.now(timezone.utc)).value == oo
+    assert len(tuple(db.history(Storable, "outer", entry_time=datetime.now(timezone(timedelta(hours=-5)))))) == 2
+
     # Read the latest version
     o_v2 = db.read(Storable, "outer").value
     assert o_v2 == oo
@@ -120,3 +145,520 @@ def test_union_store():
     db2.write(c3_2)
 
     assert u.read(Container3, "container3").value == c3_2
+
+
+def test_batched_reads():
+    c = Container(name="container", contents={"foo": 1})
+    c3 = Container3(name="container3", contents={"foo": 1}, rank=2, date=date.today())
+    n = Nested(name="nested", container=c)
+    db = MemoryStore()
+
+    with db:
+        db.write(c)
+        db.write(c3)
+        db.write(n)
+
+    sleep(0.2)
+
+    c_v2 = c.replace(contents={"foo": 2})
+    assert db.write(c_v2).result()
+
+    with db:
+        # Reads of different types and times are all answered by the one batch
+        c_v1_result = db.read(Container, "container", effective_time=c.effective_time)
+        c3_result = db.read(Container3, "container3")
+        n_result = db.read(Nested, "nested")
+
+    assert c_v1_result.value == c
+    assert c3_result.value == c3
+    assert n_result.value == n
+
+
+def test_batched_writes():
+    containers = tuple(Container(name=f"container{i}", contents={"foo": i}) for i in range(100))
+    db = MemoryStore()
+
+    with db:
+        for c in containers:
+            db.write(c)
+
+    assert all(c.effective_version == 1 and c.entry_version == 1 for c in containers)
+    assert len(set(c.entry_time for c in containers)) == 1
+
+    with db:
+        results = tuple(db.read(Container, c.name) for c in containers)
+
+    assert tuple(r.value for r in results) == containers
+
+
+def test_cached_serialisation():
+    containers = tuple(Container2(name=f"container{i}", contents={"foo": i}, rank=i) for i in range(100))
+    precompute_serialisation(containers)
+
+    assert all("object_contents" in c.__dict__ and "object_id" in c.__dict__ for c in containers)
+
+    db = MemoryStore()
+    with db:
+        for c in containers:
+            db.write(c)
+
+    # The copy must not pick up the cached contents of the original
+    c = containers[0].replace(rank=100)
+    assert c.object_contents != containers[0].object_contents
+
+    assert db.write(c).result()
+    assert db.read(Container2, c.name).value.rank == 100
+
+
+class Indexed(NamedPersistableModel):
+    index: ClassVar[Index] = Index("rank", "as_of")
+    rank: int
+    as_of: date
+    label: str
+
+
+class SlowStore(MemoryStore):
+    def _execute_reads(self, reads):
+        sleep(0.5)
+        return super()._execute_reads(reads)
+
+
+def test_union_store_concurrency():
+    db1 = SlowStore()
+    db2 = SlowStore()
+
+    c3_1 = Container3(name="container3", contents={"foo": 1}, rank=1, date=date.today())
+    db1.write(c3_1)
+
+    sleep(0.2)
+
+    c3_2 = Container3(name="container3", contents={"foo": 1}, rank=2, date=date.today())
+    db2.write(c3_2)
+
+    # The stores are read concurrently, so this takes roughly as long as one of them
+    start = monotonic()
+    assert UnionStore((db1, db2)).read(Container3, "container3").value == c3_2
+    assert monotonic() - start < 0.9
+
+    # The slow stores are ignored if they time out ...
+    fast = MemoryStore()
+    c3_3 = Container3(name="container3", contents={"foo": 1}, rank=3, date=date.today())
+    fast.write(c3_3)
+    assert UnionStore((fast, db1, db2), timeout=0.2).read(Container3, "container3").value == c3_3
+
+    # ... or once the higher priority stores have answered every read
+    start = monotonic()
+    assert UnionStore((fast, db1), return_early=True).read(Container3, "container3").value == c3_3
+    assert monotonic() - start < 0.4
+
+    # A store which hangs is skipped until its call finishes, so cannot hold up the others batch after batch
+    class HungStore(MemoryStore):
+        def _execute_reads(self, reads):
+            sleep(3)
+            return super()._execute_reads(reads)
+
+    union = UnionStore((fast, HungStore()), timeout=0.5)
+    for _ in range(4):
+        assert union.read(Container3, "container3").value == c3_3
+
+    # Scans look up each batch in the other stores, with the same timeout
+    start = monotonic()
+    assert list(UnionStore((fast, HungStore()), timeout=0.5).scan(Container3)) == [c3_3]
+    assert monotonic() - start < 1.5
+
+
+def test_async():
+    c = Container2(name="container", contents={"foo": 1}, rank=1)
+    o = Outer(name="outer", the_nested=Nested(name="nested", container=c), date=date.today())
+
+    db = MemoryStore()
+
+    async def roundtrip():
+        async with db:
+            written = await db.write_a(o)
+            assert not written.done()
+
+        assert await written
+
+        async with db:
+            result = await db.read_a(Outer, "outer")
+            missing = await db.read_a(Outer, "missing")
+
+        assert await result.value_a == o
+        assert not missing.valid
+
+        # Outside of a context, requests are executed immediately
+        result = await db.read_a(Outer, "outer")
+        assert result.done
+        assert result.value == o
+
+    run(roundtrip())
+
+    # Sync use must not depend on there being an event loop
+    assert db.read(Outer, "outer").value == o
+
+
+def test_async_concurrency():
+    # Calls made outside a context run at once, so must not share MemoryStore's single connection between threads
+    db = MemoryStore()
+
+    async def concurrent():
+        written = await gather(*(db.write_a(Container(name=f"gathered{i}", contents={"foo": i})) for i in range(200)))
+        assert all([await w for w in written])
+
+        results = await gather(*(db.read_a(Container, f"gathered{i}") for i in range(200)))
+        return [r.value.contents["foo"] for r in results]
+
+    assert run(concurrent()) == list(range(200))
+    assert db.read(Container, "gathered0").value.contents == {"foo": 0}
+
+
+def test_caching_store():
+    db = CachingStore(MemoryStore(), max_size=2, cache_latest=True)
+
+    c = Container(name="container", contents={"foo": 1})
+    assert db.write(c).result()
+
+    # The write populated the cache for reads of the latest version
+    assert db.read(Container, "container").value == c
+    assert (db.hits, db.misses) == (1, 0)
+
+    sleep(0.1)
+
+    c_v2 = c.replace(contents={"foo": 2})
+    assert db.write(c_v2).result()
+    assert db.read(Container, "container").value == c_v2
+
+    # Reads as of a past entry time are cached after the first miss
+    for _ in range(3):
+        assert db.read(Container, "container", entry_time=c.entry_time).value == c
+
+    assert (db.hits, db.misses) == (4, 1)
+
+    # Exceeding max_size evicts the least recently used
+    db.read(Container, "container", effective_time=c_v2.effective_time, entry_time=c_v2.entry_time)
+    assert db.size == 2
+    db.read(Container, "container")
+    assert db.misses == 3
+
+
+def test_coalesced_reads():
+    db = MemoryStore()
+
+    c = Container(name="container", contents={"foo": 1})
+    assert db.write(c).result()
+
+    sleep(0.1)
+
+    c_v2 = c.replace(contents={"foo": 2})
+    assert db.write(c_v2).result()
+
+    with db:
+        latest = db.read(Container, "container")
+        latest_again = db.read(Container, "container")
+        original = db.read(Container, "container", effective_time=c.effective_time)
+        missing = db.read(Container, "container", effective_time=datetime.min)
+
+    # Identical reads share a result, reads of the same id at different times do not
+    assert latest is latest_again
+    assert latest.value == c_v2
+    assert original.value == c
+    assert not missing.valid
+
+
+def test_history():
+    db = MemoryStore()
+
+    c = Container(name="container", contents={"foo": 0})
+    assert db.write(c).result()
+
+    for i in range(1, 5):
+        sleep(0.01)
+        c = c.replace(contents={"foo": i})
+        assert db.write(c).result()
+
+    history = tuple(db.history(Container, "container"))
+    assert [h.contents["foo"] for h in history] == [0, 1, 2, 3, 4]
+    assert [h.effective_version for h in history] == [1, 2, 3, 4, 5]
+
+    ranged = db.history(Container, "container",
+                        effective_from=history[1].effective_time,
+                        effective_to=history[3].effective_time)
+    assert [h.contents["foo"] for h in ranged] == [1, 2, 3]
+
+    # Correct the second version, then look at the history before and after the correction
+    assert db.write(history[1].replace(contents={"foo": -1}), as_of_effective_time=True).result()
+
+    assert [h.contents["foo"] for h in db.history(Container, "container")] == [0, -1, 2, 3, 4]
+    assert [h.contents["foo"] for h in db.history(Container, "container", entry_time=history[-1].entry_time)] ==\
+           [0, 1, 2, 3, 4]
+
+    # A union interleaves the histories of its stores
+    other = MemoryStore()
+    sleep(0.01)
+    assert other.write(Container(name="container", contents={"foo": 5})).result()
+
+    union = UnionStore((db, other))
+    assert [h.contents["foo"] for h in union.history(Container, "container")] == [0, -1, 2, 3, 4, 5]
+
+
+def test_scan():
+    db = MemoryStore()
+
+    with db:
+        for i in range(5):
+            db.write(Container(name=f"container{i}", contents={"foo": i}))
+            db.write(Container2(name=f"container2_{i}", contents={"foo": i}, rank=i))
+
+    c = db.read(Container, "container0").value
+    sleep(0.01)
+    assert db.write(c.replace(contents={"foo": -1})).result()
+
+    # Scanning a type includes its subclasses, and returns just the latest version of each
+    containers = {o.name: o for o in db.scan(Container, batch_size=3)}
+    assert len(containers) == 10
+    assert containers["container0"].contents == {"foo": -1}
+
+    assert sorted(o.name for o in db.scan(Container2)) == [f"container2_{i}" for i in range(5)]
+
+    # As of the original entry time, we see the original version
+    assert next(o for o in db.scan(Container, entry_time=c.entry_time) if o.name == "container0") == c
+
+    # A union returns each object once, in its latest version across the stores
+    other = MemoryStore()
+    with other:
+        other.write(Container(name="container1", contents={"foo": 10}))
+        other.write(Container(name="other", contents={"foo": 11}))
+
+    union = {o.name: o for o in UnionStore((db, other)).scan(Container)}
+    assert len(union) == 11
+    assert union["container1"].contents == {"foo": 10}
+    assert union["container0"].contents == {"foo": -1}
+
+
+def test_query(tmp_path):
+    db = LocalStore(str(tmp_path / "objects.db"))
+
+    with db:
+        for i in range(10):
+            db.write(Indexed(name=f"indexed{i}", rank=i % 5, as_of=date(2024, 1, 1 + i), label=f"label{i % 2}"))
+
+    # Writing the type created its indexes
+    with connect(tmp_path / "objects.db") as c:
+        indexes = set(r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+
+    assert {"idx_objects_Indexed_rank", "idx_objects_Indexed_asOf"} <= indexes
+
+    assert sorted(o.name for o in db.query(Indexed, rank=3)) == ["indexed3", "indexed8"]
+    assert [o.name for o in db.query(Indexed, as_of=date(2024, 1, 5))] == ["indexed4"]
+    assert [o.name for o in db.query(Indexed, rank=3, label="label1")] == ["indexed3"]
+
+    # Queries match the latest version only
+    original = db.read(Indexed, "indexed3").value
+    sleep(0.01)
+    assert db.write(original.replace(rank=4)).result()
+
+    assert [o.name for o in db.query(Indexed, rank=3)] == ["indexed8"]
+    assert sorted(o.name for o in db.query(Indexed, rank=3, entry_time=original.entry_time)) ==\
+           ["indexed3", "indexed8"]
+
+    with raises(ValueError):
+        db.query(Indexed, colour="red")
+
+    # Field names are put into the SQL, so must be plain identifiers, however the request was made
+    injected = "rank') OR 1=1 OR json_extract('{}', '$"
+    with raises(ValueError):
+        ScanRequest(object_id_type=original.object_id_type, criteria={injected: b"99"})
+
+    with raises(ValueError):
+        db._execute_scan(ScanRequest.model_construct(object_id_type=original.object_id_type,
+                                                     criteria={injected: b"99"}))
+
+    with raises(ValueError):
+        db.register_index(IndexRequest.model_construct(object_id_type=original.object_id_type, fields=(injected,)))
+
+    with raises(TypeError):
+        class BadlyIndexed(NamedPersistableModel):
+            index: ClassVar[Index] = Index("colour")
+
+
+def test_lazy_reads():
+    db = MemoryStore()
+    c = Container2(name="container", contents={"foo": 1, "bar": date(2024, 1, 1)}, rank=1)
+    o = Outer(name="outer", the_nested=Nested(name="nested", container=c), date=date(2024, 1, 2))
+
+    with db:
+        db.write(o)
+        db.write(Indexed(name="indexed", rank=1, as_of=date(2024, 1, 1), label="label"))
+
+    # Lazy and eager reads of the same object, in the same batch, each get what they asked for
+    with db:
+        lazy = db.read(Outer, "outer", lazy=True)
+        eager = db.read(Outer, "outer")
+
+    lazy = lazy.value
+    assert isinstance(lazy, LazyObject)
+    assert lazy.object_class is Outer
+    assert lazy.effective_version == 1
+
+    # Fields are deserialised as they are used, including subclasses of nested objects
+    assert lazy.the_nested == eager.value.the_nested
+    assert isinstance(lazy.the_nested.container, Container2)
+    assert lazy.date == date(2024, 1, 2)
+
+    # Anything else deserialises the whole object
+    assert lazy.id == eager.value.id
+    assert lazy.materialise() == eager.value
+
+    indexed = db.read(Indexed, "indexed", lazy=True).value
+    assert indexed.rank == 1 and indexed.label == "label"
+
+    assert [o.name for o in db.scan(Outer, lazy=True)] == ["outer"]
+    assert [o.label for o in db.query(Indexed, rank=1, lazy=True)] == ["label"]
+
+    with raises(NotFoundError):
+        _ = db.read(Outer, "missing", lazy=True).value
+
+    # Fields are not hidden by LazyObject's own attributes
+    class Typed(NamedPersistableModel):
+        type: str
+        object_class: str
+
+    db.write(Typed(name="typed", type="swap", object_class="rates")).result()
+    typed = db.read(Typed, "typed", lazy=True).value
+    assert (typed.type, typed.object_class) == ("swap", "rates")
+    assert [o.type for o in db.scan(Typed, lazy=True)] == ["swap"]
+
+
+def test_engine_options(tmp_path):
+    db = LocalStore(str(tmp_path / "objects.db"), pool_size=1, max_overflow=0, pool_timeout=5, pool_pre_ping=True)
+
+    c = Container(name="container", contents={"foo": 1})
+    assert db.write(c).result()
+
+    # With a single connection, concurrent reads must queue for it
+    def read(_):
+        return db.read(Container, "container").value
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(r == c for r in executor.map(read, range(8)))
+
+    # The in-memory DB has one connection, shared by all threads, so cannot be sized
+    with raises(TypeError):
+        MemoryStore(pool_size=2)
+
+
+def test_temp_store():
+    def sidecar_files() -> set[str]:
+        return set(f for f in listdir(gettempdir()) if f.endswith(("-wal", "-shm")))
+
+    before = sidecar_files()
+    db = TempStore()
+    assert db.write(Container(name="temporary", contents={"foo": 1})).result()
+    assert db.read(Container, "temporary").value.contents == {"foo": 1}
+
+    # Temporary DBs do not use WAL, which would leave files behind
+    assert sidecar_files() <= before
+
+
+def test_local_store_concurrency(tmp_path):
+    filename = str(tmp_path / "objects.db")
+    db = LocalStore(filename)
+
+    c = Container(name="container", contents={"foo": 1})
+    assert db.write(c).result()
+
+    # Another process writing does not block our reads
+    with connect(filename, isolation_level=None) as writer:
+        assert writer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("INSERT INTO transactions (username, hostname, comment) VALUES ('user', 'host', '')")
+
+        assert LocalStore(filename).read(Container, "container").value == c
+
+        writer.execute("ROLLBACK")
+
+
+def test_compression(tmp_path):
+    def write(filename: str, compress: bool) -> LocalStore:
+        db = LocalStore(str(tmp_path / filename), compress=compress)
+        with db:
+            for i in range(100):
+                db.write(Indexed(name=f"indexed{i}", rank=i % 5, as_of=date(2024, 1, 1 + i % 28), label=f"label{i}"))
+
+        return db
+
+    def contents_size(filename: str) -> int:
+        with connect(tmp_path / filename) as c:
+            return c.execute("SELECT SUM(LENGTH(object_contents)) FROM objects").fetchone()[0]
+
+    db = write("compressed.db", True)
+    write("uncompressed.db", False)
+    assert contents_size("compressed.db") * 2 < contents_size("uncompressed.db")
+
+    # The dictionary used is recorded, so other stores can read the contents, however they were opened
+    with connect(tmp_path / "compressed.db") as c:
+        assert c.execute("SELECT object_type, codec FROM dictionaries").fetchall() == [("Indexed", "zlib")]
+
+    other = LocalStore(str(tmp_path / "compressed.db"))
+    assert other.read(Indexed, "indexed7").value == db.read(Indexed, "indexed7").value
+    assert other.read(Indexed, "indexed7").value.label == "label7"
+
+    # Queries are still answered, though not by the DB
+    assert sorted(o.name for o in db.query(Indexed, rank=3))[:3] == ["indexed13", "indexed18", "indexed23"]
+    assert [o.name for o in other.query(Indexed, label="label42")] == ["indexed42"]
+    assert len(tuple(db.history(Indexed, "indexed0"))) == 1
+
+    # The limit applies to the objects matching, as callers page through them until one comes back empty
+    scan = db._execute_scan(ScanRequest(object_id_type="Indexed", criteria={"label": b'"label99"'}, limit=5))
+    assert [r.object_id for r in scan] == [b'["indexed99"]']
+    assert len(tuple(db._execute_scan(ScanRequest(object_id_type="Indexed", criteria={"rank": b"3"}, limit=5)))) == 5
+
+
+class Snapshot(ImmutableModel):
+    prices: dict[str, float]
+
+
+class CountingStore(MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.exists = 0
+        self.written = 0
+
+    def _execute_exists(self, reads):
+        self.exists += 1
+        return super()._execute_exists(reads)
+
+    def _execute_writes(self, writes):
+        self.written += len(writes.writes)
+        return super()._execute_writes(writes)
+
+
+def test_immutable_writes():
+    db = CountingStore()
+    snapshot = Snapshot(prices={"foo": 1., "bar": 2.})
+
+    assert db.write(snapshot).result()
+    assert db.read(Snapshot, snapshot.content_hash).value == snapshot
+    assert (db.exists, db.written) == (1, 1)
+
+    # Writing the same contents again sends nothing: we know they are in the store
+    again = Snapshot(prices={"foo": 1., "bar": 2.})
+    assert db.write(again).result()
+    assert again.entry_time == snapshot.entry_time
+    assert (db.exists, db.written) == (1, 1)
+
+    # Another client asks the store, once per batch, and sends just the new contents, once each
+    client = UnionStore((db,))
+
+    with client:
+        results = [client.write(Snapshot(prices={"foo": 1., "bar": 2.})) for _ in range(2)] +\
+                  [client.write(Snapshot(prices={"foo": float(i)})) for i in range(2, 5)] * 2
+
+    assert all(r.result() for r in results)
+    assert (db.exists, db.written) == (2, 4)
+    assert len(tuple(db.scan(Snapshot))) == 4
+
+    with raises(RuntimeError):
+        db.write(snapshot, as_of_effective_time=True)
@@ -1,9 +1,9 @@
 from datetime import date
 from pydantic import ValidationError
-from typing import Any
+from typing import Any, get_args
 
 from object_model import BaseModel
-from object_model._json import dumps, loads
+from object_model._json import dumps, dumps_many, loads, loads_many
 
 from .shared_pydantic_types import Container, Container2, Container3, Nested, Outer
 
@@ -21,6 +21,19 @@ def test_one_of():
     test_container(Container2(name="container", contents={"foo": 1}, rank=1))
 
 
+def test_many():
+    containers = [Container2(name=f"container{i}", contents={"foo": i}, rank=i) for i in range(10)]
+    o = Outer(name="outer", the_nested=Nested(name="nested", container=containers[0]), date=date(1970, 1, 1))
+
+    buffers = dumps_many(containers + [o])
+    assert buffers == [dumps(c) for c in containers + [o]]
+
+    assert loads_many(buffers[:-1], Container2) == containers
+    assert loads_many([b.decode() for b in buffers[:-1]], Container2) == containers
+    assert loads_many(buffers[-1:], Outer) == [o]
+    assert loads_many([], Outer) == []
+
+
 def test_camel_case():
     c = Container2(name="container", contents={"foo": 1}, rank=1)
     o = Outer(name="outer", the_nested=Nested(name="nested", container=c), date=date(1970, 1, 1))
@@ -68,6 +81,31 @@ def test_unsupported_types():
         assert True
 
 
+def test_checked_types():
+    class IntOrStr(BaseModel):
+        value: int | str
+        values: list[int]
+
+    class StrOrInt(BaseModel):
+        value: str | int
+        values: list[int]
+
+    # Annotations are checked and rewritten once, but unions which differ only in order are different annotations
+    assert IntOrStr.__annotations__["values"] is StrOrInt.__annotations__["values"]
+    assert get_args(IntOrStr.__annotations__["value"]) == (int, str)
+    assert get_args(StrOrInt.__annotations__["value"]) == (str, int)
+
+    # Failures are not remembered
+    for _ in range(2):
+        try:
+            class BadlyChecked(BaseModel):
+                foo: list[Any]
+
+            assert False
+        except TypeError:
+            assert True
+
+
 def test_immutable_collections():
     class MyCollections(BaseModel):
         my_list: list[str]
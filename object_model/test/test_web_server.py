@@ -0,0 +1,206 @@
+from asyncio import gather, run
+from datetime import date, datetime
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+from gzip import compress
+from orjson import dumps as orjson_dumps, loads
+from pydantic import ValidationError
+from pytest import raises
+
+from object_model import dumps
+from object_model.store.object_record import ObjectRecord
+from object_model.store.object_store import HistoryRequest, IndexRequest, ReadRequest, ScanRequest, WriteRequest
+from object_model.store import web_server
+from object_model.store.wire import MEDIA_TYPE, dump_records, dump_request, load_records, load_request
+
+from .shared_pydantic_types import Container2
+
+
+def test_concurrent_requests():
+    containers = tuple(Container2(name=f"container{i}", contents={"foo": i}, rank=i) for i in range(10))
+
+    def write_request(c: Container2) -> WriteRequest:
+        record = ObjectRecord(object_type=c.object_type,
+                              object_id_type=c.object_id_type,
+                              object_id=c.object_id,
+                              object_contents=c.object_contents,
+                              effective_version=1,
+                              entry_version=1)
+
+        return WriteRequest(writes=(record,), username="user", hostname="host", comment=str(date.today()))
+
+    async def requests():
+        written = await gather(*(web_server.write(write_request(c)) for c in containers))
+        assert all(len(w) == 1 for w in written)
+
+        reads = tuple(ObjectRecord(object_id_type=c.object_id_type, object_id=c.object_id) for c in containers)
+        return await web_server.read(ReadRequest(reads=reads))
+
+    records = run(requests())
+    assert sorted(r.object_id for r in records) == sorted(c.object_id for c in containers)
+
+
+def test_history_paging():
+    container = Container2(name="history", contents={"foo": 0}, rank=0)
+    records = tuple(ObjectRecord(object_type=container.object_type,
+                                 object_id_type=container.object_id_type,
+                                 object_id=container.object_id,
+                                 object_contents=container.object_contents,
+                                 effective_version=v,
+                                 entry_version=1) for v in range(1, 6))
+
+    run(web_server.write(WriteRequest(writes=records, username="user", hostname="host", comment="")))
+
+    page_size = web_server.page_size
+    web_server.page_size = 2
+
+    try:
+        versions = []
+        after_version = 0
+
+        while page := run(web_server.history(HistoryRequest(object_id_type=container.object_id_type,
+                                                             object_id=container.object_id,
+                                                             after_version=after_version))):
+            assert len(page) <= 2
+            versions.extend(r.effective_version for r in page)
+            after_version = versions[-1]
+    finally:
+        web_server.page_size = page_size
+
+    assert versions == [1, 2, 3, 4, 5]
+
+
+def test_scan_paging():
+    containers = tuple(Container2(name=f"scanned{i}", contents={"foo": i}, rank=i) for i in range(5))
+    records = tuple(ObjectRecord(object_type=c.object_type,
+                                 object_id_type=c.object_id_type,
+                                 object_id=c.object_id,
+                                 object_contents=c.object_contents,
+                                 effective_version=1,
+                                 entry_version=1) for c in containers)
+
+    run(web_server.write(WriteRequest(writes=records, username="user", hostname="host", comment="")))
+
+    page_size = web_server.page_size
+    web_server.page_size = 2
+
+    try:
+        object_ids = []
+        after_object_id = None
+
+        while page := run(web_server.scan(ScanRequest(object_id_type=containers[0].object_id_type,
+                                                      after_object_id=after_object_id))):
+            assert len(page) <= 2
+            object_ids.extend(r.object_id for r in page)
+            after_object_id = object_ids[-1]
+    finally:
+        web_server.page_size = page_size
+
+    assert set(c.object_id for c in containers) <= set(object_ids)
+    assert len(object_ids) == len(set(object_ids))
+
+
+def test_request_validation():
+    # Requests arrive as JSON, so their records must be validated back into the right types
+    container = Container2(name="validation", contents={"foo": 0}, rank=0)
+    request = ReadRequest(reads=(ObjectRecord(object_id_type=container.object_id_type,
+                                              object_id=container.object_id,
+                                              effective_time=datetime(2024, 1, 1)),))
+
+    read = ReadRequest.model_validate_json(dumps(request)).reads[0]
+    assert read.object_id == container.object_id
+    assert read.effective_time == datetime(2024, 1, 1)
+
+    # Field and type names end up in SQL, so anything but a plain identifier is rejected
+    with raises(ValidationError):
+        ScanRequest.model_validate_json(b'{"object_id_type": "Container", "criteria": {"rank\') OR 1=1": "1"}}')
+
+    with raises(ValidationError):
+        IndexRequest.model_validate_json(b'{"object_id_type": "Container\\"; DROP TABLE objects; --", "fields": []}')
+
+
+def test_binary_protocol():
+    containers = tuple(Container2(name=f"binary{i}", contents={"foo": i}, rank=i) for i in range(3))
+    records = tuple(ObjectRecord(object_type=c.object_type,
+                                 object_id_type=c.object_id_type,
+                                 object_id=c.object_id,
+                                 object_contents=c.object_contents,
+                                 effective_version=1,
+                                 entry_version=1) for c in containers)
+
+    request = WriteRequest(writes=records, username="user", hostname="host", comment="binary")
+    assert load_request(WriteRequest, dump_request(request)) == request
+
+    written = run(web_server.write(load_request(WriteRequest, dump_request(request))))
+    received, _ = load_records(dump_records(written))
+    assert received == written
+    assert all(r.object_store_id is not None and r.entry_time < datetime.max for r in received)
+
+
+def test_malformed_binary_requests():
+    container = Container2(name="malformed", contents={"foo": 0}, rank=0)
+    record = ObjectRecord(object_type=container.object_type,
+                          object_id_type=container.object_id_type,
+                          object_id=container.object_id,
+                          object_contents=container.object_contents,
+                          effective_version=1,
+                          entry_version=1)
+    data = dump_request(WriteRequest(writes=(record,), username="user", hostname="host", comment=""))
+
+    # Headers with values of the wrong type, truncated messages and garbage are all rejected
+    header_length = int.from_bytes(data[:4], "big")
+    header = loads(data[4:4 + header_length])
+    header["records"][0][6:8] = ["v", "w"]
+    badly_typed = orjson_dumps(header)
+    badly_typed = len(badly_typed).to_bytes(4, "big") + badly_typed + data[4 + header_length:]
+
+    route = next(r for r in web_server.app.routes if getattr(r, "path", None) == "/write/")
+    handler = route.get_route_handler()
+
+    for body in (badly_typed, data[:-1], data + b"x", b"\x00\x00\x00\x04junk", b"\x00"):
+        with raises(ValueError):
+            load_request(WriteRequest, body)
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request({"type": "http", "method": "POST", "path": "/write/", "query_string": b"",
+                           "headers": [(b"content-type", MEDIA_TYPE.encode())]}, receive)
+
+        with raises(RequestValidationError):
+            run(handler(request))
+
+
+def test_compressed_requests():
+    containers = tuple(Container2(name=f"gzip{i}", contents={"foo": i}, rank=i) for i in range(50))
+    records = tuple(ObjectRecord(object_type=c.object_type,
+                                 object_id_type=c.object_id_type,
+                                 object_id=c.object_id,
+                                 object_contents=c.object_contents,
+                                 effective_version=1,
+                                 entry_version=1) for c in containers)
+
+    request = WriteRequest(writes=records, username="user", hostname="host", comment="gzip")
+    client = TestClient(web_server.app)
+
+    # A compressed request is decompressed, and the response (large enough to be worth it) compressed
+    response = client.post("/write/", content=compress(dumps(request)),
+                           headers={"content-type": "application/json", "content-encoding": "gzip",
+                                    "accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == len(containers)
+
+    # Bodies which decompress to more than the maximum size are rejected before they are decompressed in full
+    bomb = compress(b" " * (16 * 1024 * 1024))
+    limited = TestClient(web_server.GUnzipMiddleware(web_server.app, max_size=1024 * 1024))
+    response = limited.post("/write/", content=bomb,
+                            headers={"content-type": "application/json", "content-encoding": "gzip"})
+    assert response.status_code == 413
+
+    # As are bodies which are not gzip, or are truncated
+    for body in (b"not gzip", compress(dumps(request))[:-10]):
+        response = client.post("/write/", content=body,
+                               headers={"content-type": "application/json", "content-encoding": "gzip"})
+        assert response.status_code == 400